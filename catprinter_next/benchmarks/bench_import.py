@@ -0,0 +1,110 @@
+"""
+打印服务冷启动基准测试
+
+在全新的子进程中多次导入print_service，统计导入耗时，并检查重量级依赖
+没有在模块导入时被加载。超出预算或加载了重量级依赖时以非零状态码退出。
+
+用法:
+    python benchmarks/bench_import.py [--runs 20] [--budget-ms 50] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import compileall
+import statistics
+import subprocess
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 这些模块只能在首次使用时加载
+HEAVY_MODULES = [
+    "requests", "sqlalchemy", "serial",
+    "app.config", "app.models.order", "app.models.dish", "app.utils.formatters"
+]
+
+# 默认冷启动预算（毫秒），只统计print_service本身的导入时间
+DEFAULT_BUDGET_MS = 50.0
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import print_service
+elapsed = (time.perf_counter() - start) * 1000
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"import_ms": elapsed, "heavy_modules": heavy}}))
+"""
+
+
+def measure_once():
+    """
+    在全新的解释器中导入一次print_service
+    
+    Returns:
+        dict: 包含import_ms和heavy_modules的测量结果
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs, budget_ms):
+    """
+    执行基准测试
+    
+    Args:
+        runs: 测量次数
+        budget_ms: 导入耗时中位数的预算（毫秒）
+        
+    Returns:
+        dict: 基准测试结果
+    """
+    # 预先生成字节码，与部署环境一致，避免把编译时间算进冷启动
+    compileall.compile_file(os.path.join(SERVICE_DIR, "print_service.py"), quiet=1)
+    
+    samples = []
+    heavy_modules = set()
+    for _ in range(runs):
+        result = measure_once()
+        samples.append(result["import_ms"])
+        heavy_modules.update(result["heavy_modules"])
+    
+    median_ms = statistics.median(samples)
+    return {
+        "benchmark": "print_service.import",
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "median_ms": round(median_ms, 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "budget_ms": budget_ms,
+        "heavy_modules": sorted(heavy_modules),
+        "passed": median_ms <= budget_ms and not heavy_modules
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="print_service冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=20, help="测量次数")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="导入耗时中位数预算（毫秒）")
+    parser.add_argument("--json", action="store_true", help="只输出JSON结果")
+    args = parser.parse_args()
+    
+    result = run(args.runs, args.budget_ms)
+    
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"print_service导入耗时: 中位数 {result['median_ms']}ms "
+              f"(最小 {result['min_ms']}ms, 最大 {result['max_ms']}ms, 预算 {args.budget_ms}ms)")
+        if result["heavy_modules"]:
+            print(f"导入时加载了重量级依赖: {', '.join(result['heavy_modules'])}")
+        print("通过" if result["passed"] else "未通过")
+    
+    return 0 if result["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""
+打印流程热点路径微基准测试
+
+覆盖饮料/食物分类、小票格式化、飞鹅云签名和参数构建、SQLite中的PrintLog写入，
+以及不同日志规模下的报表函数。结果以JSON输出，可以用--compare与上一个版本对比。
+
+依赖后端代码（app.models、app.utils.formatters）或sqlalchemy的测试在缺少依赖时
+记为skipped，执行出错的测试组记为error，都不影响其他测试。
+
+用法:
+    python benchmarks/bench_pipeline.py [--output results.json] [--compare baseline.json]
+                                        [--sizes 1000,10000,100000] [--only classify,feieyun]
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+import print_service  # noqa: E402
+from fixtures import load_menu, generate_orders  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# 对比时超过该比例视为性能退化
+REGRESSION_THRESHOLD = 1.10
+
+
+class BenchmarkSkipped(Exception):
+    """缺少依赖，跳过该基准测试"""
+
+
+def measure(func, number, repeat=5):
+    """
+    多轮执行函数并统计单次耗时
+
+    Args:
+        func: 无参数的被测函数
+        number: 每轮调用次数
+        repeat: 轮数
+
+    Returns:
+        dict: 单次调用耗时统计，单位微秒
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter_ns() - start) / number / 1000)
+    return {
+        "unit": "us",
+        "number": number,
+        "repeat": repeat,
+        "median": round(statistics.median(samples), 3),
+        "min": round(min(samples), 3),
+        "max": round(max(samples), 3)
+    }
+
+
+def _cycle(values):
+    """返回依次循环取值的函数，避免每次测量同一个对象"""
+    state = {"index": 0}
+
+    def next_value():
+        value = values[state["index"] % len(values)]
+        state["index"] += 1
+        return value
+    return next_value
+
+
+def _load_formatter(backend):
+    try:
+        return print_service.load_backend(backend)
+    except ImportError as e:
+        raise BenchmarkSkipped(f"无法加载{backend}: {e}")
+
+
+def bench_classify(orders, untyped_orders):
+    """饮料/食物分类，分别测试有food_type和只能靠code、名称识别的情况"""
+    typed = _cycle(orders)
+    untyped = _cycle(untyped_orders)
+    yield "classify.typed", {}, measure(
+        lambda: print_service.split_beverage_food(typed().items), number=len(orders))
+    yield "classify.untyped", {}, measure(
+        lambda: print_service.split_beverage_food(untyped().items), number=len(orders))
+
+
+def bench_format(orders):
+    """ESC/POS和飞鹅云小票格式化"""
+    style = _load_formatter("print_style")()
+    for name, backend in (("format.escpos", "escpos_formatter"), ("format.feieyun", "feieyun_formatter")):
+        formatter = _load_formatter(backend)(style)
+        next_order = _cycle(orders)
+        yield name, {}, measure(lambda: formatter.format(next_order()), number=len(orders))
+
+
+def _sample_content(orders):
+    """构建飞鹅云小票内容，格式化器不可用时使用简化的小票"""
+    try:
+        formatter = _load_formatter("feieyun_formatter")(_load_formatter("print_style")())
+        return formatter.format(orders[0])
+    except BenchmarkSkipped:
+        lines = [f"<CB>{orders[0].order_no}</CB><BR>"]
+        lines += [f"{item.qty}x {item.name}<BR>" for item in orders[0].items]
+        return "".join(lines)
+
+
+def bench_feieyun(orders):
+    """飞鹅云签名和请求参数构建"""
+    client = print_service.FeieyunClient("bench@example.com", "BENCHUKEY0123456", "http://127.0.0.1/Api/Open/")
+    timestamp = str(int(time.time()))
+    content = _sample_content(orders)
+    yield "feieyun.signature", {}, measure(lambda: client.generate_signature(timestamp), number=10000)
+    yield "feieyun.build_params", {}, measure(
+        lambda: client.build_params('Open_printMsg', sn="BENCHSN01", content=content, times="1"), number=10000)
+
+
+def _create_session():
+    """创建内存SQLite会话并建表"""
+    try:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models.order import PrintLog
+        from app.models.dish import Dish
+    except ImportError as e:
+        raise BenchmarkSkipped(f"无法加载数据库模型: {e}")
+
+    # 模型导入后才会注册到metadata，报表测试还需要菜品表
+    engine = create_engine("sqlite://")
+    for metadata in {PrintLog.metadata, Dish.metadata}:
+        metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def bench_printlog_write(orders):
+    """按打印策略的方式写入PrintLog：先写pending，再更新为success"""
+    db = _create_session()
+    from app.models.order import PrintLog
+    next_order = _cycle(orders)
+
+    def write():
+        order = next_order()
+        print_log = PrintLog(
+            order_id=str(order.id), user_id=order.user_id,
+            printer_sn="BENCHSN01", status="pending", content="bench"
+        )
+        db.add(print_log)
+        db.commit()
+        print_log.status = "success"
+        print_log.response_code = "0"
+        db.commit()
+
+    yield "printlog.write", {"backend": "sqlite"}, measure(write, number=200)
+    db.close()
+
+
+def _populate_report_data(db, menu, log_count, report_date):
+    """写入菜品、订单和打印日志，平均每个订单两条日志（饮料单和食物单）"""
+    from sqlalchemy import insert
+    from app.models.order import Order, PrintLog
+    from app.models.dish import Dish
+
+    db.add_all(Dish(code=dish.code, name=dish.name, price=dish.price, category=dish.category)
+               for dish in menu if dish.code)
+    db.commit()
+
+    item_class = Order.items.property.mapper.class_
+    start_time = datetime.combine(report_date, datetime.min.time()) + timedelta(hours=11)
+    order_count = max(log_count // 2, 1)
+    bench_orders = generate_orders(order_count, menu=menu, start_time=start_time)
+
+    batch = []
+    for bench_order in bench_orders:
+        order = Order(
+            user_id=bench_order.user_id, order_no=bench_order.order_no,
+            table_no=bench_order.table_no, date_time=bench_order.date_time,
+            status="printed", print_count=1
+        )
+        order.items = [item_class(name=item.name, code=item.code, qty=item.qty) for item in bench_order.items]
+        batch.append(order)
+        if len(batch) >= 5000:
+            db.add_all(batch)
+            db.commit()
+            batch = []
+    db.add_all(batch)
+    db.commit()
+
+    order_ids = [str(order_id) for (order_id,) in db.query(Order.id).all()]
+    logs = []
+    for i in range(log_count):
+        logs.append({
+            "order_id": order_ids[i % len(order_ids)],
+            "user_id": "bench",
+            "printer_sn": ("BENCHSN01", "BENCHSN02")[i % 2],
+            "status": "success" if i % 50 else "failed",
+            "content": "bench",
+            "response_code": "0",
+            "response_msg": "ok",
+            "print_time": start_time + timedelta(seconds=(i * 86400 // log_count) % 46800)
+        })
+        if len(logs) >= 10000:
+            db.execute(insert(PrintLog), logs)
+            logs = []
+    if logs:
+        db.execute(insert(PrintLog), logs)
+    db.commit()
+
+
+def bench_reports(menu, sizes):
+    """不同日志规模下的日报、打印机汇总和流式导出"""
+    report_date = datetime.now().date()
+    for size in sizes:
+        db = _create_session()
+        _populate_report_data(db, menu, size, report_date)
+        params = {"log_rows": size}
+        repeat = 3 if size >= 100000 else 5
+
+        yield "report.daily_summary", params, measure(
+            lambda: print_service.PrintReportService.get_daily_print_summary(db, report_date), 1, repeat)
+        yield "report.printer_summary", params, measure(
+            lambda: print_service.PrintReportService.get_printer_summary(db, report_date), 1, repeat)
+
+        exporter = print_service.PrintHistoryExporter(db)
+        yield "report.export_csv", params, measure(
+            lambda: exporter.export(io.StringIO(), report_date, report_date, "csv"), 1, repeat)
+        yield "report.export_ndjson", params, measure(
+            lambda: exporter.export(io.StringIO(), report_date, report_date, "ndjson"), 1, repeat)
+        db.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, only=None):
+    """
+    执行所有基准测试
+
+    Args:
+        sizes: 报表测试的日志行数列表
+        only: 只执行名称以这些前缀开头的测试组，为None时全部执行
+
+    Returns:
+        dict: 包含环境信息和测试结果的字典
+    """
+    menu = load_menu()
+    orders = generate_orders(1000, menu=menu)
+    untyped_orders = generate_orders(1000, menu=menu, with_food_type=False)
+
+    groups = [
+        ("classify", lambda: bench_classify(orders, untyped_orders)),
+        ("format", lambda: bench_format(orders)),
+        ("feieyun", lambda: bench_feieyun(orders)),
+        ("printlog", lambda: bench_printlog_write(orders)),
+        ("report", lambda: bench_reports(menu, sizes))
+    ]
+
+    results = []
+    for group, bench in groups:
+        if only and group not in only:
+            continue
+        try:
+            for name, params, stats in bench():
+                results.append({"name": name, "params": params, **stats})
+                print(f"{name} {params or ''}: {stats['median']}us", file=sys.stderr)
+        except BenchmarkSkipped as e:
+            results.append({"name": group, "skipped": str(e)})
+            print(f"{group}: 跳过 ({e})", file=sys.stderr)
+        except Exception as e:
+            # 单个测试组出错时记录错误，继续执行其他测试组
+            results.append({"name": group, "error": f"{type(e).__name__}: {e}"})
+            print(f"{group}: 出错 ({type(e).__name__}: {e})", file=sys.stderr)
+
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "git_commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "orders": len(orders)
+        },
+        "results": results
+    }
+
+
+def _result_key(result):
+    return result["name"], json.dumps(result.get("params", {}), sort_keys=True)
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD, only=None):
+    """
+    与基线结果对比
+
+    基线中有计时结果、但本次缺失、跳过或出错的测试同样视为失败，
+    用--only排除的测试组除外。
+
+    Args:
+        current: 本次结果
+        baseline: 基线结果
+        threshold: 中位数比值超过该值视为退化
+        only: 本次执行的测试组，为None时表示全部执行
+
+    Returns:
+        list: 退化或缺失的测试名称列表
+    """
+    baseline_map = {_result_key(r): r for r in baseline["results"] if "median" in r}
+    regressions = []
+    measured = set()
+    for result in current["results"]:
+        old = baseline_map.get(_result_key(result))
+        if "median" not in result or not old:
+            continue
+        measured.add(_result_key(result))
+        if not old["median"]:
+            continue
+        ratio = result["median"] / old["median"]
+        flag = ""
+        if ratio > threshold:
+            flag = " <- 退化"
+            regressions.append(result["name"])
+        print(f"{result['name']} {result['params'] or ''}: {old['median']}us -> {result['median']}us "
+              f"({ratio:.2f}x){flag}", file=sys.stderr)
+
+    for key, old in baseline_map.items():
+        if key in measured or (only and old["name"].split(".")[0] not in only):
+            continue
+        regressions.append(old["name"])
+        print(f"{old['name']} {old.get('params') or ''}: {old['median']}us -> 缺失", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="打印流程微基准测试")
+    parser.add_argument("--output", help="结果JSON文件路径，默认输出到标准输出")
+    parser.add_argument("--compare", help="用于对比的基线结果JSON文件")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="报表测试的日志行数，逗号分隔")
+    parser.add_argument("--only", help="只执行指定的测试组，逗号分隔：classify,format,feieyun,printlog,report")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    only = set(args.only.split(",")) if args.only else None
+    result = run(sizes, only)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    exit_code = 0
+    if any("error" in r for r in result["results"]):
+        exit_code = 1
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(result, baseline, only=only):
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+基准测试和压测共用的数据
+
+从LeDu Happy Dumpling-menu-export.csv读取真实菜单，按固定随机种子生成订单，
+保证不同版本之间的测试数据完全一致。
+"""
+import os
+import csv
+import random
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MENU_CSV = os.path.join(REPO_ROOT, "LeDu Happy Dumpling-menu-export.csv")
+
+# 菜单导出中不再使用的分类
+IGNORED_MENUS = {"muell"}
+
+# 每单菜品数及其权重：大多数是小订单，偶尔有外卖大单
+ORDER_SIZES = [1, 2, 3, 4, 5, 6, 8, 12, 20, 40]
+ORDER_SIZE_WEIGHTS = [10, 20, 20, 15, 10, 8, 6, 5, 4, 2]
+
+
+class MenuDish:
+    """菜单中的菜品"""
+    __slots__ = ("code", "name", "price", "category", "food_type")
+
+    def __init__(self, code, name, price, category, food_type):
+        self.code = code
+        self.name = name
+        self.price = price
+        self.category = category
+        self.food_type = food_type
+
+
+class BenchOrderItem:
+    """与订单菜品字段一致的测试菜品"""
+    __slots__ = ("name", "code", "qty", "price", "food_type", "category", "detail")
+
+    def __init__(self, name, code, qty, price, food_type=None, category=None, detail=None):
+        self.name = name
+        self.code = code
+        self.qty = qty
+        self.price = price
+        self.food_type = food_type
+        self.category = category
+        self.detail = detail
+
+
+class BenchOrder:
+    """与Order字段一致的测试订单，不依赖数据库"""
+    __slots__ = (
+        "id", "user_id", "order_no", "table_no", "date_time",
+        "status", "print_count", "last_print_time", "items"
+    )
+
+    def __init__(self, id, user_id, order_no, table_no, date_time, items):
+        self.id = id
+        self.user_id = user_id
+        self.order_no = order_no
+        self.table_no = table_no
+        self.date_time = date_time
+        self.status = "pending"
+        self.print_count = 0
+        self.last_print_time = None
+        self.items = items
+
+
+def load_menu(path=MENU_CSV):
+    """
+    读取菜单导出文件
+
+    Args:
+        path: CSV文件路径
+
+    Returns:
+        list: MenuDish列表
+    """
+    dishes = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if row["Menu"] in IGNORED_MENUS:
+                continue
+            dishes.append(MenuDish(
+                code=row["Numeration"].strip() or None,
+                name=(row["Name (en)"] or row["Name (de)"]).strip(),
+                price=float(row["Price (€)"] or 0),
+                category=row["Menu"],
+                food_type="beverage" if row["Type"] == "饮料" else "food"
+            ))
+    return dishes
+
+
+def generate_orders(count, seed=42, menu=None, user_id="bench", with_food_type=True, start_time=None):
+    """
+    按固定随机种子生成订单
+
+    Args:
+        count: 订单数
+        seed: 随机种子
+        menu: 菜单，如果为None则读取默认菜单
+        user_id: 餐厅用户ID
+        with_food_type: 是否填写food_type，为False时只能通过code和名称识别饮料
+        start_time: 第一单的下单时间，如果为None则使用当天11:00
+
+    Returns:
+        list: BenchOrder列表
+    """
+    rng = random.Random(seed)
+    menu = menu or load_menu()
+    if start_time is None:
+        start_time = datetime.combine(datetime.now().date(), datetime.min.time()) + timedelta(hours=11)
+
+    orders = []
+    for i in range(count):
+        size = rng.choices(ORDER_SIZES, ORDER_SIZE_WEIGHTS)[0]
+        items = []
+        for dish in rng.sample(menu, min(size, len(menu))):
+            items.append(BenchOrderItem(
+                name=dish.name,
+                code=dish.code,
+                qty=rng.choice((1, 1, 1, 2, 2, 3)),
+                price=dish.price,
+                food_type=dish.food_type if with_food_type else None,
+                category=dish.category
+            ))
+        orders.append(BenchOrder(
+            id=i + 1,
+            user_id=user_id,
+            order_no=f"B{i + 1:06d}",
+            table_no=str(rng.randint(1, 30)),
+            date_time=start_time + timedelta(seconds=i * 20),
+            items=items
+        ))
+    return orders
@@ -0,0 +1,361 @@
+"""
+高峰期回放压测工具
+
+把合成或录制的订单流按到达时间回放到PrintStrategyFactory / CategoryPrinterStrategy，
+打印机和飞鹅云都替换为本地替身（见standins.py），统计吞吐量、延迟分位数，以及
+OrderPrinter重试带来的请求放大。
+
+按--rates逐级加压，输出每一级的结果和延迟仍满足--latency-slo的最高速率。
+
+录制的订单流为JSONL，每行一个订单，offset为相对开始的到达秒数：
+    {"offset": 1.5, "order_no": "A001", "table_no": "3",
+     "items": [{"name": "Coca-Cola", "code": null, "qty": 2, "food_type": "beverage", "category": "Soft Drink"}]}
+
+用法:
+    python benchmarks/loadtest.py --mode feieyun --rates 60,120,240,480 --orders 200
+    python benchmarks/loadtest.py --mode category --replay rush_hour.jsonl --speedup 2
+    python benchmarks/loadtest.py --mode socket --printer-speed 1500 --printer-fail-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+import print_service  # noqa: E402
+from fixtures import BenchOrder, BenchOrderItem, generate_orders  # noqa: E402
+from standins import FakeEscPosPrinter, FakeFeieyunAPI  # noqa: E402
+
+MODES = ("socket", "feieyun", "category")
+
+# 分类模式下的路由：厨房打印机打印饺子，吧台打印机打印饮料，其他分类走飞鹅云
+KITCHEN_CATEGORIES = {"Dumplings", "Gebraten Dumplings"}
+BAR_CATEGORIES = {"Soft Drink", "Bier & Wein", "Special Teas"}
+
+LOADTEST_SN = "LOADTESTSN01"
+
+
+class CountingStrategy(print_service.PrintStrategy):
+    """统计打印调用次数的策略包装，用于计算重试放大"""
+
+    def __init__(self, base_strategy, counter):
+        super().__init__(base_strategy.print_style)
+        self.base_strategy = base_strategy
+        self.counter = counter
+
+    @property
+    def destination(self):
+        return self.base_strategy.destination
+
+    def print(self, order, db):
+        self.counter.increment()
+        return self.base_strategy.print(order, db)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.value += 1
+
+
+def standin_config_cache(feieyun_client, kitchen, bar):
+    """
+    创建分类到本地替身打印机的餐厅配置缓存
+
+    Args:
+        feieyun_client: 飞鹅云替身的客户端
+        kitchen: 厨房打印机替身
+        bar: 吧台打印机替身
+
+    Returns:
+        TenantConfigCache: 配置缓存
+    """
+    category_printers = {}
+    for categories, printer in ((KITCHEN_CATEGORIES, kitchen), (BAR_CATEGORIES, bar)):
+        host, port = printer.address
+        for category in categories:
+            category_printers[category] = [
+                print_service.PrinterInfo("socket", socket_ip=host, socket_port=port)
+            ]
+
+    def loader(db, user_id):
+        return print_service.TenantPrintConfig(
+            user_id, category_printers, print_service.get_default_print_style(),
+            feieyun_client=feieyun_client
+        )
+    return print_service.TenantConfigCache(loader)
+
+
+def load_replay(path, speedup=1.0):
+    """
+    读取录制的订单流
+
+    Args:
+        path: JSONL文件路径
+        speedup: 回放加速倍数
+
+    Returns:
+        list: (到达秒数, 订单)列表，按到达时间排序
+    """
+    schedule = []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get("items"):
+                skipped += 1
+                continue
+            items = [BenchOrderItem(
+                name=item.get("name", ""),
+                code=item.get("code"),
+                qty=item.get("qty") or 1,
+                price=item.get("price"),
+                food_type=item.get("food_type"),
+                category=item.get("category")
+            ) for item in record["items"]]
+            order = BenchOrder(
+                id=record.get("id", line_no),
+                user_id=record.get("user_id", "loadtest"),
+                order_no=record.get("order_no", f"R{line_no:06d}"),
+                table_no=str(record.get("table_no", "")),
+                date_time=datetime.now(),
+                items=items
+            )
+            schedule.append((float(record.get("offset", 0)) / speedup, order))
+    if skipped:
+        print(f"跳过{skipped}行没有菜品的记录", file=sys.stderr)
+    schedule.sort(key=lambda entry: entry[0])
+    return schedule
+
+
+def synthetic_schedule(rate_per_minute, count, seed):
+    """按固定速率生成订单流"""
+    interval = 60.0 / rate_per_minute
+    orders = generate_orders(count, seed=seed, user_id="loadtest")
+    return [(i * interval, order) for i, order in enumerate(orders)]
+
+
+def create_session_factory(db_path):
+    """创建SQLite会话工厂，缺少依赖时返回None"""
+    try:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models.order import PrintLog
+    except ImportError as e:
+        print(f"无法加载数据库模型，压测需要在后端环境中运行: {e}", file=sys.stderr)
+        return None
+
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    PrintLog.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def percentile(values, pct):
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Stage:
+    """一级压测：启动替身，回放订单流，统计结果"""
+
+    def __init__(self, args, schedule, session_factory):
+        self.args = args
+        self.schedule = schedule
+        self.session_factory = session_factory
+        self.attempts = Counter()
+        self._local = threading.local()
+        self.printers = []
+        self.feieyun = None
+
+    def _start_standins(self):
+        if self.args.mode in ("socket", "category"):
+            count = 1 if self.args.mode == "socket" else 2
+            for i in range(count):
+                self.printers.append(FakeEscPosPrinter(
+                    bytes_per_second=self.args.printer_speed,
+                    fail_rate=self.args.printer_fail_rate,
+                    offline_seconds=self.args.printer_offline_seconds,
+                    seed=self.args.seed + i
+                ).start())
+        if self.args.mode in ("feieyun", "category"):
+            self.feieyun = FakeFeieyunAPI(
+                latency=self.args.feieyun_latency,
+                jitter=self.args.feieyun_jitter,
+                error_rate=self.args.feieyun_error_rate,
+                error_code=self.args.feieyun_error_code,
+                http_error_rate=self.args.feieyun_http_error_rate,
+                seed=self.args.seed
+            ).start()
+
+    def _stop_standins(self):
+        for printer in self.printers:
+            printer.stop()
+        if self.feieyun:
+            self.feieyun.stop()
+
+    def _make_strategy(self):
+        """每个工作线程使用独立的策略和HTTP会话"""
+        client = None
+        if self.feieyun:
+            client = print_service.FeieyunClient("loadtest", "LOADTESTUKEY", self.feieyun.url)
+
+        if self.args.mode == "socket":
+            host, port = self.printers[0].address
+            strategy = print_service.PrintStrategyFactory.create_strategy(
+                "socket", socket_ip=host, socket_port=port)
+        elif self.args.mode == "feieyun":
+            strategy = print_service.PrintStrategyFactory.create_strategy(
+                "feieyun", feieyun_sn=LOADTEST_SN, client=client)
+        else:
+            strategy = print_service.CategoryPrinterStrategy(
+                config_cache=standin_config_cache(client, self.printers[0], self.printers[1]))
+        return CountingStrategy(strategy, self.attempts)
+
+    def _worker_state(self):
+        if not hasattr(self._local, "strategy"):
+            self._local.strategy = self._make_strategy()
+            self._local.db = self.session_factory()
+        return self._local.strategy, self._local.db
+
+    def _process(self, order, scheduled_at):
+        strategy, db = self._worker_state()
+        try:
+            result = print_service.OrderPrinter(strategy).execute(order, db, max_retries=self.args.max_retries)
+            success = bool(result.get("success"))
+        except Exception as e:
+            print(f"订单{order.order_no}异常: {e}", file=sys.stderr)
+            success = False
+        finished_at = time.monotonic()
+        return success, finished_at - scheduled_at, finished_at
+
+    def run(self):
+        self._start_standins()
+        try:
+            with ThreadPoolExecutor(self.args.workers) as pool:
+                start = time.monotonic()
+                futures = []
+                for offset, order in self.schedule:
+                    scheduled_at = start + offset
+                    delay = scheduled_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(pool.submit(self._process, order, scheduled_at))
+                outcomes = [future.result() for future in futures]
+        finally:
+            self._stop_standins()
+
+        latencies = [latency * 1000 for _, latency, _ in outcomes]
+        successes = sum(1 for success, _, _ in outcomes if success)
+        elapsed = max(finished for _, _, finished in outcomes) - start if outcomes else 0.0
+        orders = len(outcomes)
+        offered_span = self.schedule[-1][0] if len(self.schedule) > 1 else 0.0
+
+        return {
+            "orders": orders,
+            "offered_rate_per_min": round(orders / offered_span * 60, 1) if offered_span else None,
+            "throughput_per_min": round(orders / elapsed * 60, 1) if elapsed else None,
+            "success_rate": round(successes / orders, 4) if orders else None,
+            "latency_ms": {
+                "p50": _round(percentile(latencies, 50)),
+                "p90": _round(percentile(latencies, 90)),
+                "p99": _round(percentile(latencies, 99)),
+                "max": _round(max(latencies) if latencies else None)
+            },
+            "print_attempts": self.attempts.value,
+            "retry_amplification": round(self.attempts.value / orders, 3) if orders else None,
+            "printers": [printer.stats() for printer in self.printers],
+            "feieyun": self.feieyun.stats() if self.feieyun else None
+        }
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="高峰期订单回放压测")
+    parser.add_argument("--mode", choices=MODES, default="feieyun", help="打印路径")
+    parser.add_argument("--rates", default="60,120,240,480", help="逐级加压的订单速率（单/分钟），逗号分隔")
+    parser.add_argument("--orders", type=int, default=200, help="每一级的订单数")
+    parser.add_argument("--replay", help="录制的订单流JSONL文件，指定后忽略--rates")
+    parser.add_argument("--speedup", type=float, default=1.0, help="回放加速倍数")
+    parser.add_argument("--workers", type=int, default=8, help="并发处理订单的线程数")
+    parser.add_argument("--max-retries", type=int, default=3, help="OrderPrinter最大重试次数")
+    parser.add_argument("--latency-slo", type=float, default=3000.0, help="p99延迟目标（毫秒）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--printer-speed", type=float, default=2000.0, help="ESC/POS打印机替身速度（字节/秒）")
+    parser.add_argument("--printer-fail-rate", type=float, default=0.0, help="ESC/POS打印机替身每张小票后掉线的概率")
+    parser.add_argument("--printer-offline-seconds", type=float, default=1.0,
+                        help="ESC/POS打印机替身每次掉线的时长（秒）")
+    parser.add_argument("--feieyun-latency", type=float, default=0.08, help="飞鹅云替身基础延迟（秒）")
+    parser.add_argument("--feieyun-jitter", type=float, default=0.04, help="飞鹅云替身延迟浮动（秒）")
+    parser.add_argument("--feieyun-error-rate", type=float, default=0.0, help="飞鹅云替身业务错误比例")
+    parser.add_argument("--feieyun-error-code", type=int, default=-2, help="飞鹅云替身注入的错误码")
+    parser.add_argument("--feieyun-http-error-rate", type=float, default=0.0, help="飞鹅云替身HTTP 502比例")
+    parser.add_argument("--output", help="结果JSON文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        session_factory = create_session_factory(os.path.join(tmpdir, "loadtest.db"))
+        if session_factory is None:
+            return 2
+
+        if args.replay:
+            stages = [("replay", load_replay(args.replay, args.speedup))]
+        else:
+            stages = [(float(rate), synthetic_schedule(float(rate), args.orders, args.seed))
+                      for rate in args.rates.split(",") if rate]
+
+        results = []
+        for label, schedule in stages:
+            result = Stage(args, schedule, session_factory).run()
+            result["stage"] = label
+            results.append(result)
+            print(f"[{label}] 吞吐 {result['throughput_per_min']}单/分钟, "
+                  f"p50 {result['latency_ms']['p50']}ms, p99 {result['latency_ms']['p99']}ms, "
+                  f"成功率 {result['success_rate']}, 重试放大 {result['retry_amplification']}x",
+                  file=sys.stderr)
+
+    # 延迟和成功率仍达标的最高速率
+    sustainable = [
+        result["offered_rate_per_min"] for result in results
+        if result["latency_ms"]["p99"] is not None and result["latency_ms"]["p99"] <= args.latency_slo
+        and result["success_rate"] >= 0.99 and result["offered_rate_per_min"]
+    ]
+    summary = {
+        "mode": args.mode,
+        "workers": args.workers,
+        "max_retries": args.max_retries,
+        "latency_slo_ms": args.latency_slo,
+        "max_sustainable_rate_per_min": max(sustainable) if sustainable else None,
+        "stages": results
+    }
+
+    output = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+压测用的本地打印机和飞鹅云替身
+
+FakeEscPosPrinter模拟局域网ESC/POS打印机：同一时间只处理一张小票，按配置的
+打印速度出纸，打印期间不接受新连接，客户端会阻塞在connect上甚至超时；
+可以按比例模拟掉线，掉线期间连接被拒绝。
+
+FakeFeieyunAPI模拟飞鹅云开放API：支持Open_printMsg、Open_queryPrinterStatus和
+Open_queryOrderState，可以注入延迟、业务错误码和HTTP错误。
+"""
+import json
+import time
+import random
+import socket
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeEscPosPrinter:
+    """本地ESC/POS打印机替身"""
+
+    def __init__(self, host="127.0.0.1", port=0, bytes_per_second=2000.0, fail_rate=0.0,
+                 offline_seconds=1.0, backlog=1, seed=None):
+        """
+        初始化打印机替身
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            bytes_per_second: 打印速度，按小票字节数折算出纸时间
+            fail_rate: 每打印完一张小票后掉线的概率（0-1）
+            offline_seconds: 每次掉线的时长（秒），期间连接被拒绝
+            backlog: 打印时内核最多排队的连接数，排满后新连接会阻塞直到超时
+            seed: 故障注入的随机种子
+        """
+        self.bytes_per_second = bytes_per_second
+        self.fail_rate = fail_rate
+        self.offline_seconds = offline_seconds
+        self.backlog = backlog
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.tickets = 0
+        self.bytes_printed = 0
+        self.offline_events = 0
+        self.busy_seconds = 0.0
+        self.last_finished_at = None
+        self._listener = None
+        self._address = (host, port)
+        self._listen()
+        self._thread = None
+
+    def _listen(self):
+        """开始监听，端口为0时记录实际分配的端口，掉线恢复后沿用"""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self._address)
+        listener.listen(self.backlog)
+        listener.settimeout(0.2)
+        self._address = listener.getsockname()
+        self._listener = listener
+
+    @property
+    def address(self):
+        """(IP, 端口)"""
+        return self._address
+
+    def _go_offline(self):
+        """关闭监听模拟掉线，期间新连接直接被拒绝"""
+        # 已经完成握手的连接在关闭监听时会被重置，而客户端可能已经发送完毕，
+        # 先把它们打印完，保证故障只表现为连接被拒绝
+        self._listener.setblocking(False)
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                break
+            self._print_connection(conn)
+        self._listener.close()
+        with self._lock:
+            self.offline_events += 1
+        if not self._stop_event.wait(self.offline_seconds):
+            self._listen()
+
+    def print_ticket(self, data):
+        """按打印速度模拟出纸"""
+        duration = len(data) / self.bytes_per_second if self.bytes_per_second else 0.0
+        time.sleep(duration)
+        with self._lock:
+            self.tickets += 1
+            self.bytes_printed += len(data)
+            self.busy_seconds += duration
+            self.last_finished_at = time.monotonic()
+
+    def _print_connection(self, conn):
+        """读取一个连接上的完整小票并打印"""
+        with conn:
+            conn.settimeout(5.0)
+            chunks = []
+            try:
+                while True:
+                    data = conn.recv(4096)
+                    if not data:
+                        break
+                    chunks.append(data)
+            except socket.timeout:
+                pass
+        self.print_ticket(b"".join(chunks))
+
+    def _serve(self):
+        """
+        逐个接收并打印小票
+
+        打印期间不接受新连接，只有内核backlog中的连接能完成握手，
+        其余连接阻塞在connect上，直到打印头空闲或客户端超时。
+        """
+        while not self._stop_event.is_set():
+            try:
+                conn, _ = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._stop_event.is_set():
+                    return
+                raise
+
+            self._print_connection(conn)
+            if self._rng.random() < self.fail_rate:
+                self._go_offline()
+
+    def stats(self):
+        """打印机侧统计"""
+        with self._lock:
+            return {
+                "address": f"{self.address[0]}:{self.address[1]}",
+                "tickets": self.tickets,
+                "bytes": self.bytes_printed,
+                "offline_events": self.offline_events,
+                "busy_seconds": round(self.busy_seconds, 3)
+            }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="fake-escpos", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self._listener.close()
+
+
+class _FeieyunHandler(BaseHTTPRequestHandler):
+    """处理飞鹅云API请求"""
+
+    def do_POST(self):
+        api = self.server.api
+        length = int(self.headers.get("Content-Length") or 0)
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        status, body = api.handle(params)
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeFeieyunAPI:
+    """本地飞鹅云API替身"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.02, error_rate=0.0,
+                 error_code=-2, http_error_rate=0.0, print_seconds=2.0, offline_sns=None, seed=None):
+        """
+        初始化飞鹅云API替身
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            latency: 每个请求的基础延迟（秒）
+            jitter: 延迟的随机浮动上限（秒）
+            error_rate: Open_printMsg返回业务错误的比例（0-1）
+            error_code: 注入的业务错误码
+            http_error_rate: 返回HTTP 502的比例（0-1）
+            print_seconds: 任务被接受后多久确认出纸
+            offline_sns: 离线打印机SN列表
+            seed: 延迟和故障注入的随机种子
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.http_error_rate = http_error_rate
+        self.print_seconds = print_seconds
+        self.offline_sns = set(offline_sns or [])
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        # 飞鹅云订单ID -> 接受时间
+        self._jobs = {}
+        self.requests = {}
+        self.injected_errors = 0
+        self._server = ThreadingHTTPServer((host, port), _FeieyunHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/Api/Open/"
+
+    def handle(self, params):
+        """
+        处理一次API调用
+
+        Args:
+            params: 表单参数
+
+        Returns:
+            tuple: (HTTP状态码, 响应JSON)
+        """
+        apiname = params.get("apiname")
+        with self._lock:
+            self.requests[apiname] = self.requests.get(apiname, 0) + 1
+            delay = self.latency + self._rng.random() * self.jitter
+            http_error = self._rng.random() < self.http_error_rate
+            business_error = self._rng.random() < self.error_rate
+        time.sleep(delay)
+
+        if http_error:
+            with self._lock:
+                self.injected_errors += 1
+            return 502, {"msg": "bad gateway"}
+
+        if apiname == "Open_printMsg":
+            if business_error or params.get("sn") in self.offline_sns:
+                with self._lock:
+                    self.injected_errors += 1
+                return 200, {"ret": self.error_code, "msg": "注入的错误", "data": None}
+            with self._lock:
+                self._sequence += 1
+                order_id = f"{params.get('sn')}_{self._sequence}"
+                self._jobs[order_id] = time.monotonic()
+            return 200, {"ret": 0, "msg": "ok", "data": order_id}
+
+        if apiname == "Open_queryPrinterStatus":
+            status = "离线。" if params.get("sn") in self.offline_sns else "在线，工作状态正常。"
+            return 200, {"ret": 0, "msg": "ok", "data": status}
+
+        if apiname == "Open_queryOrderState":
+            with self._lock:
+                accepted_at = self._jobs.get(params.get("orderid"))
+            printed = accepted_at is not None and time.monotonic() - accepted_at >= self.print_seconds
+            return 200, {"ret": 0, "msg": "ok", "data": printed}
+
+        return 200, {"ret": 1001, "msg": f"未知接口: {apiname}", "data": None}
+
+    def stats(self):
+        """API侧统计"""
+        with self._lock:
+            return {
+                "url": self.url,
+                "requests": dict(self.requests),
+                "accepted_jobs": len(self._jobs),
+                "injected_errors": self.injected_errors
+            }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-feieyun", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,24 +1,201 @@
+from __future__ import annotations
+
+import csv
+import copy
+import json
 import time
+import heapq
 import socket
-import requests
+import logging
+import importlib
+import threading
 from hashlib import sha1
-from datetime import datetime
-from sqlalchemy.orm import Session
-from typing import List, Dict, Optional
-
-from app.models.order import Order, PrintLog
-from app.models.dish import Dish
-from app.utils.formatters import EscPosFormatter, FeieyunFormatter, PrintStyle
-from app.config import (
-    FEIEYUN_USER, FEIEYUN_UKEY, FEIEYUN_URL, 
-    FEIEYUN_SN, SOCKET_PRINTER_IP, SOCKET_PRINTER_PORT,
-    SOCKET_TIMEOUT, PRINT_COPIES
-)
-from app.models.setting import Printer
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, List, Dict, Optional, Iterator
+
+# 仅用于类型注解，运行时在使用处延迟导入，避免拖慢冷启动
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from app.models.order import Order
+    from app.models.setting import Printer
+
+logger = logging.getLogger(__name__)
 
 # 饮料和食品始终分开打印，不作为可选项
 SEPARATE_BEVERAGE_FOOD = True
 
+# 后端注册表：名称 -> (模块路径, 属性名)，属性名为None时返回模块本身
+# 传输库、格式化器和配置都在首次使用时才导入
+BACKENDS = {
+    "config": ("app.config", None),
+    "http": ("requests", None),
+    "serial": ("serial", None),
+    "print_style": ("app.utils.formatters", "PrintStyle"),
+    "escpos_formatter": ("app.utils.formatters", "EscPosFormatter"),
+    "feieyun_formatter": ("app.utils.formatters", "FeieyunFormatter")
+}
+
+_loaded_backends = {}
+
+
+def register_backend(name: str, module_path: str, attr: str = None):
+    """
+    注册或替换后端
+    
+    Args:
+        name: 后端名称
+        module_path: 模块路径
+        attr: 模块中的属性名，为None时使用模块本身
+    """
+    BACKENDS[name] = (module_path, attr)
+    _loaded_backends.pop(name, None)
+
+
+def load_backend(name: str):
+    """
+    加载后端，首次加载后缓存
+    
+    Args:
+        name: 后端名称
+        
+    Returns:
+        后端模块或属性
+    """
+    backend = _loaded_backends.get(name)
+    if backend is None:
+        if name not in BACKENDS:
+            raise ValueError(f"未注册的后端: {name}")
+        module_path, attr = BACKENDS[name]
+        backend = importlib.import_module(module_path)
+        if attr:
+            backend = getattr(backend, attr)
+        _loaded_backends[name] = backend
+    return backend
+
+# 打印任务优先级分类
+PRIORITY_NEW_ORDER = "new_order"
+PRIORITY_ADD_ON = "add_on"
+PRIORITY_REPRINT = "reprint"
+PRIORITY_REPORT = "report"
+
+# 各优先级在加权公平队列中的权重，权重越大分到的打印机时间越多
+PRIORITY_WEIGHTS = {
+    PRIORITY_NEW_ORDER: 8,
+    PRIORITY_ADD_ON: 4,
+    PRIORITY_REPRINT: 2,
+    PRIORITY_REPORT: 1
+}
+
+
+class PrintSlip:
+    """
+    订单打印单的只读轻量视图
+    
+    只保存订单头字段和菜品元组，拆分订单时用来代替新建的Order对象，
+    不会被加入数据库会话。格式化器和打印策略都可以直接接收。
+    """
+    __slots__ = (
+        "id", "user_id", "order_no", "table_no", "date_time",
+        "status", "print_count", "last_print_time", "items", "parts"
+    )
+    
+    def __init__(self, order, items=None, part=None, label_part=False):
+        """
+        初始化打印单
+        
+        Args:
+            order: 订单对象或其他打印单
+            items: 打印单包含的菜品，如果为None则使用订单的全部菜品
+            part: (第几张, 共几张)，表示该打印单是订单某次拆分中的第几张
+            label_part: 是否在单号后标注第几张
+        """
+        for name in ("id", "user_id", "order_no", "table_no", "date_time",
+                     "status", "print_count", "last_print_time"):
+            object.__setattr__(self, name, getattr(order, name))
+        object.__setattr__(self, "items", tuple(order.items if items is None else items))
+        
+        # 从原始订单到该打印单的每一级拆分，轮询器据此判断订单的所有打印单是否都已出纸
+        parts = getattr(order, "parts", ())
+        if part is not None:
+            parts += (tuple(part),)
+            if label_part:
+                object.__setattr__(self, "order_no", f"{order.order_no} ({part[0]}/{part[1]})")
+        object.__setattr__(self, "parts", parts)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("PrintSlip是只读的")
+    
+    def __delattr__(self, name):
+        raise AttributeError("PrintSlip是只读的")
+    
+    def __repr__(self):
+        return f"<PrintSlip order_no={self.order_no!r} items={len(self.items)}>"
+
+
+# 通过名称识别饮料的关键字
+BEVERAGE_KEYWORDS = ("cola", "soda", "water", "juice", "tea", "coffee")
+
+
+def is_beverage_item(item) -> bool:
+    """
+    判断菜品是否为饮料
+    
+    Args:
+        item: 订单菜品
+        
+    Returns:
+        bool: 是否为饮料
+    """
+    # 通过food_type判断
+    if hasattr(item, 'food_type') and item.food_type == "beverage":
+        return True
+    # 通过code判断
+    if item.code and (item.code.startswith("COC") or item.code.startswith("BEV")):
+        return True
+    # 通过名称判断
+    if hasattr(item, 'name') and any(drink in item.name.lower() for drink in BEVERAGE_KEYWORDS):
+        return True
+    return False
+
+
+def split_beverage_food(items) -> tuple:
+    """
+    将菜品分为饮料和食物两部分
+    
+    Args:
+        items: 订单菜品列表
+        
+    Returns:
+        tuple: (饮料列表, 食物列表)
+    """
+    beverage_items = []
+    food_items = []
+    for item in items:
+        if is_beverage_item(item):
+            beverage_items.append(item)
+        else:
+            food_items.append(item)
+    return beverage_items, food_items
+
+
+def mark_order_printed(order, db: Session):
+    """
+    更新订单打印状态
+    
+    打印单只是订单的视图，由拆分订单的调用方在全部打印成功后更新原始订单。
+    
+    Args:
+        order: 订单对象或打印单
+        db: 数据库会话
+    """
+    if isinstance(order, PrintSlip):
+        return
+    
+    order.status = "printed"
+    order.print_count += 1
+    order.last_print_time = datetime.now()
+    db.commit()
+
 
 class PrintStrategy:
     """打印策略基类接口"""
@@ -29,7 +206,39 @@ class PrintStrategy:
         Args:
             print_style: 打印样式配置
         """
-        self.print_style = print_style or PrintStyle()
+        self.print_style = print_style or load_backend("print_style")()
+        self._formatter = None
+    
+    # 格式化器后端名称，子类按需设置
+    formatter_backend = None
+    
+    @property
+    def formatter(self):
+        """格式化器，首次使用时才加载"""
+        if self._formatter is None:
+            self._formatter = load_backend(self.formatter_backend)(self.print_style)
+        return self._formatter
+    
+    @property
+    def destination(self) -> str:
+        """目标打印机标识，与PrintLog.printer_sn保持一致，用于调度器按打印机排队"""
+        return "default"
+    
+    def with_scheduler(self, scheduler: PrintScheduler, priority=PRIORITY_NEW_ORDER) -> PrintStrategy:
+        """
+        返回经调度器排队打印的策略
+        
+        直接连接打印机的策略整体排队；拆分订单的策略重写此方法，只让拆分后
+        直接连接打印机的策略排队，保证每张打印单排在它实际的目标打印机上。
+        
+        Args:
+            scheduler: 打印调度器
+            priority: 优先级分类
+            
+        Returns:
+            PrintStrategy: 经调度器排队的策略
+        """
+        return ScheduledPrintStrategy(self, scheduler, priority)
     
     def print(self, order: Order, db: Session):
         """
@@ -47,10 +256,28 @@ class PrintStrategy:
 
 class EscPosPrintStrategy(PrintStrategy):
     """ESC/POS Socket直连打印策略"""
-    def __init__(self, print_style=None):
-        """初始化Socket打印策略"""
+    formatter_backend = "escpos_formatter"
+    
+    def __init__(self, print_style=None, socket_ip=None, socket_port=None):
+        """
+        初始化Socket打印策略
+        
+        Args:
+            print_style: 打印样式配置
+            socket_ip: 打印机IP，如果为None则使用配置中的默认打印机
+            socket_port: 打印机端口，如果为None则使用配置中的默认端口
+        """
         super().__init__(print_style)
-        self.formatter = EscPosFormatter(print_style)
+        self.socket_ip = socket_ip
+        self.socket_port = socket_port
+    
+    @property
+    def destination(self) -> str:
+        if not self.socket_ip:
+            return "socket_local"
+        if self.socket_port:
+            return f"socket_{self.socket_ip}:{self.socket_port}"
+        return f"socket_{self.socket_ip}"
     
     def print(self, order: Order, db: Session):
         """
@@ -63,13 +290,15 @@ class EscPosPrintStrategy(PrintStrategy):
         Returns:
             dict: 包含打印结果的字典
         """
+        from app.models.order import PrintLog
+        
         # 格式化订单内容
         content = self.formatter.format(order)
         
         # 创建打印日志记录
         print_log = PrintLog(
             order_id=str(order.id), user_id=order.user_id,
-            printer_sn="socket_local",
+            printer_sn=self.destination,
             status="pending",
             content=content
         )
@@ -78,9 +307,13 @@ class EscPosPrintStrategy(PrintStrategy):
         
         try:
             # 创建TCP Socket连接
+            config = load_backend("config")
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(SOCKET_TIMEOUT)
-            sock.connect((SOCKET_PRINTER_IP, SOCKET_PRINTER_PORT))
+            sock.settimeout(config.SOCKET_TIMEOUT)
+            sock.connect((
+                self.socket_ip or config.SOCKET_PRINTER_IP,
+                self.socket_port or config.SOCKET_PRINTER_PORT
+            ))
             
             # 发送打印内容
             sock.send(content.encode())
@@ -93,10 +326,7 @@ class EscPosPrintStrategy(PrintStrategy):
             db.commit()
             
             # 更新订单打印状态
-            order.status = "printed"
-            order.print_count += 1
-            order.last_print_time = datetime.now()
-            db.commit()
+            mark_order_printed(order, db)
             
             return {
                 "success": True,
@@ -146,6 +376,8 @@ class EscPosPrintStrategy(PrintStrategy):
 
 class USBPrintStrategy(PrintStrategy):
     """USB/串口打印策略"""
+    formatter_backend = "escpos_formatter"
+    
     def __init__(self, print_style=None, port=None):
         """
         初始化USB打印策略
@@ -155,9 +387,12 @@ class USBPrintStrategy(PrintStrategy):
             port: USB端口，如果为None则使用默认端口
         """
         super().__init__(print_style)
-        self.formatter = EscPosFormatter(print_style)
         self.port = port or "COM1"  # 默认COM1端口
     
+    @property
+    def destination(self) -> str:
+        return f"usb_{self.port}"
+    
     def print(self, order: Order, db: Session):
         """
         通过USB/串口发送ESC/POS命令打印订单
@@ -171,7 +406,7 @@ class USBPrintStrategy(PrintStrategy):
         """
         try:
             # 尝试导入串口库
-            import serial
+            serial = load_backend("serial")
         except ImportError:
             return {
                 "success": False,
@@ -179,6 +414,8 @@ class USBPrintStrategy(PrintStrategy):
                 "code": "import_error"
             }
         
+        from app.models.order import PrintLog
+        
         # 格式化订单内容
         content = self.formatter.format(order)
         
@@ -207,10 +444,7 @@ class USBPrintStrategy(PrintStrategy):
             db.commit()
             
             # 更新订单打印状态
-            order.status = "printed"
-            order.print_count += 1
-            order.last_print_time = datetime.now()
-            db.commit()
+            mark_order_printed(order, db)
             
             return {
                 "success": True,
@@ -245,25 +479,51 @@ class USBPrintStrategy(PrintStrategy):
             }
 
 
-class FeieyunPrintStrategy(PrintStrategy):
-    """飞鹅云HTTP API打印策略"""
-    def __init__(self, print_style=None, feieyun_sn=None, feieyun_user=None, feieyun_ukey=None, feieyun_url=None):
-        """初始化飞鹅云打印策略"""
-        super().__init__(print_style)
-        self.formatter = FeieyunFormatter(print_style)
-        
-        # 使用传入的参数，如果没有则使用默认值
-        self.feieyun_sn = feieyun_sn or FEIEYUN_SN
-        self.feieyun_user = feieyun_user or FEIEYUN_USER
-        self.feieyun_ukey = feieyun_ukey or FEIEYUN_UKEY
-        
-        # 强制使用新的API地址
-        self.feieyun_url = "http://api.de.feieyun.com/Api/Open/"
+# 飞鹅云API地址，统一使用德国区域
+FEIEYUN_API_URL = "http://api.de.feieyun.com/Api/Open/"
+
+
+class FeieyunHTTPError(Exception):
+    """飞鹅云API返回非200的HTTP状态码"""
+    
+    def __init__(self, status_code):
+        super().__init__(f"HTTP错误: {status_code}")
+        self.status_code = status_code
+
+
+class FeieyunClient:
+    """
+    飞鹅云开放API客户端
+    
+    负责签名和HTTP请求，测试时可以用继承此类并重写call的本地替身替换。
+    """
+    
+    def __init__(self, feieyun_user=None, feieyun_ukey=None, feieyun_url=None, timeout=30):
+        """
+        初始化飞鹅云API客户端
         
-        # 打印调试信息
-        print(f"[FeieyunPrintStrategy] 初始化完成，使用API地址: {self.feieyun_url}")
+        Args:
+            feieyun_user: 飞鹅云账号
+            feieyun_ukey: 飞鹅云UKEY
+            feieyun_url: API地址，如果为None则使用FEIEYUN_API_URL
+            timeout: HTTP请求超时时间（秒）
+        """
+        # 账号齐全时不需要加载配置
+        config = None if feieyun_user and feieyun_ukey else load_backend("config")
+        self.feieyun_user = feieyun_user or config.FEIEYUN_USER
+        self.feieyun_ukey = feieyun_ukey or config.FEIEYUN_UKEY
+        self.feieyun_url = feieyun_url or FEIEYUN_API_URL
+        self.timeout = timeout
+        self._session = None
     
-    def _generate_signature(self, timestamp):
+    @property
+    def session(self):
+        """HTTP会话，首次请求时才加载requests并创建，轮询时复用连接"""
+        if self._session is None:
+            self._session = load_backend("http").Session()
+        return self._session
+    
+    def generate_signature(self, timestamp):
         """
         生成飞鹅云API签名
         
@@ -277,380 +537,1570 @@ class FeieyunPrintStrategy(PrintStrategy):
         sign_string = self.feieyun_user + self.feieyun_ukey + timestamp
         
         # 使用SHA1算法生成签名
-        signature = sha1(sign_string.encode()).hexdigest()
-        return signature
+        return sha1(sign_string.encode()).hexdigest()
     
-    def print(self, order: Order, db: Session):
+    def build_params(self, apiname, **params):
         """
-        通过飞鹅云API打印订单
+        构建带签名的API请求参数
         
         Args:
-            order: 订单对象
-            db: 数据库会话
+            apiname: API名称，如Open_printMsg
+            **params: 接口参数
             
         Returns:
-            dict: 包含打印结果的字典
+            dict: 请求参数
         """
-        # 格式化订单内容
-        content = self.formatter.format(order)
-        
-        # 创建打印日志记录
-        print_log = PrintLog(
-            order_id=str(order.id), user_id=order.user_id,
-            printer_sn=self.feieyun_sn,
-            status="pending",
-            content=content
-        )
-        db.add(print_log)
-        db.commit()
+        timestamp = str(int(time.time()))
+        request_params = {
+            'user': self.feieyun_user,
+            'sig': self.generate_signature(timestamp),
+            'stime': timestamp,
+            'apiname': apiname
+        }
+        request_params.update(params)
+        return request_params
+    
+    def call(self, apiname, **params):
+        """
+        调用飞鹅云API
         
-        try:
-            # 准备API请求参数
-            timestamp = str(int(time.time()))
-            sig = self._generate_signature(timestamp)
-            
-            params = {
-                'user': self.feieyun_user,
-                'sig': sig,
-                'stime': timestamp,
-                'apiname': 'Open_printMsg',
-                'sn': self.feieyun_sn,
-                'content': content,
-                'times': str(self.print_style.copies)  # 打印联数使用配置的值
-            }
-            
-            # 发送HTTP请求
-            response = requests.post(self.feieyun_url, data=params, timeout=30)
+        Args:
+            apiname: API名称
+            **params: 接口参数
             
-            # 处理响应
-            if response.status_code == 200:
-                result = response.json()
-                
-                # 打印成功
-                if result.get('ret') == 0:
-                    print_log.status = "success"
-                    print_log.response_code = str(result.get('ret'))
-                    print_log.response_msg = result.get('msg', '打印成功')
-                    db.commit()
-                    
-                    # 更新订单打印状态
-                    order.status = "printed"
-                    order.print_count += 1
-                    order.last_print_time = datetime.now()
-                    db.commit()
-                    
-                    return {
-                        "success": True,
-                        "message": "打印成功",
-                        "code": str(result.get('ret')),
-                        "content": content
-                    }
-                # 打印失败
-                else:
-                    print_log.status = "failed"
-                    print_log.response_code = str(result.get('ret'))
-                    print_log.response_msg = result.get('msg', '打印失败')
-                    db.commit()
-                    
-                    return {
-                        "success": False,
-                        "message": f"打印失败: {result.get('msg')}",
-                        "code": str(result.get('ret')),
-                        "content": content
-                    }
-            # HTTP错误
-            else:
-                print_log.status = "failed"
-                print_log.response_code = str(response.status_code)
-                print_log.response_msg = f"HTTP错误: {response.status_code}"
-                db.commit()
-                
-                return {
-                    "success": False,
-                    "message": f"打印失败: HTTP错误 {response.status_code}",
-                    "code": str(response.status_code)
-                }
-        # 异常错误
-        except Exception as e:
-            print_log.status = "failed"
-            print_log.response_code = "error"
-            print_log.response_msg = str(e)
-            db.commit()
+        Returns:
+            dict: API返回的JSON结果
             
-            return {
-                "success": False,
-                "message": f"打印失败: {str(e)}",
-                "code": "error"
-            }
+        Raises:
+            FeieyunHTTPError: HTTP状态码不是200
+        """
+        response = self.session.post(
+            self.feieyun_url, data=self.build_params(apiname, **params), timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise FeieyunHTTPError(response.status_code)
+        return response.json()
 
 
-class PrintStrategyFactory:
-    """打印策略工厂"""
+# 飞鹅云打印机状态
+PRINTER_ONLINE = "online"
+PRINTER_OFFLINE = "offline"
+PRINTER_ABNORMAL = "abnormal"
+
+
+def parse_feieyun_printer_status(data) -> str:
+    """
+    解析Open_queryPrinterStatus返回的状态文本
     
-    @staticmethod
-    def create_strategy(print_type, print_style=None, separate_beverage_food=None, **kwargs):
+    Args:
+        data: 接口返回的data字段，如"离线。"、"在线，工作状态正常。"
+        
+    Returns:
+        str: PRINTER_ONLINE、PRINTER_OFFLINE或PRINTER_ABNORMAL
+    """
+    text = str(data or "").lower()
+    if "离线" in text or "offline" in text:
+        return PRINTER_OFFLINE
+    # 在线但工作状态不正常，通常是缺纸或开盖
+    if "不正常" in text or "abnormal" in text or "not normal" in text:
+        return PRINTER_ABNORMAL
+    return PRINTER_ONLINE
+
+
+class PrinterStatusCache:
+    """带过期时间的打印机状态缓存"""
+    
+    def __init__(self, ttl=60):
         """
-        创建打印策略
+        初始化打印机状态缓存
         
         Args:
-            print_type: 打印机类型，可以是"feieyun"、"socket"、"usb"等
-            print_style: 打印样式配置
-            separate_beverage_food: 已废弃，始终使用True
-            **kwargs: 传递给打印策略的额外参数
+            ttl: 状态有效期（秒）
+        """
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+    
+    def set(self, sn: str, status: str):
+        """记录打印机状态"""
+        with self._lock:
+            self._entries[sn] = (status, time.monotonic())
+    
+    def get(self, sn: str) -> Optional[str]:
+        """
+        获取打印机状态
+        
+        Args:
+            sn: 打印机SN
             
         Returns:
-            PrintStrategy: 打印策略实例
+            Optional[str]: 打印机状态，未知或已过期时返回None
         """
-        # 设置打印样式
-        if not print_style:
-            print_style = PrintStyle(copies=PRINT_COPIES)
-        
-        # 始终分开打印饮料和食物
-        separate_beverage_food = True
-        
-        # 创建基础打印策略
-        if print_type == "feieyun":
-            base_strategy = FeieyunPrintStrategy(print_style, **kwargs)
-        elif print_type == "socket":
-            base_strategy = EscPosPrintStrategy(print_style)
-        elif print_type == "usb":
-            base_strategy = USBPrintStrategy(print_style, **kwargs.get("port"))
-        else:
-            raise ValueError(f"不支持的打印类型: {print_type}")
+        with self._lock:
+            entry = self._entries.get(sn)
+        if not entry:
+            return None
+        status, updated_at = entry
+        if time.monotonic() - updated_at > self.ttl:
+            return None
+        return status
+    
+    def is_available(self, sn: str) -> bool:
+        """
+        判断打印机是否可以接收打印任务
         
-        # 始终使用装饰器模式包装基础策略实现分开打印
-        return SeparateBeverageFoodPrintStrategy(base_strategy, print_style)
+        状态未知时视为可用，交给飞鹅云返回结果判断。
+        """
+        status = self.get(sn)
+        return status is None or status == PRINTER_ONLINE
 
 
-class SeparateBeverageFoodPrintStrategy(PrintStrategy):
-    """饮料和食物分开打印策略"""
-    def __init__(self, base_strategy: PrintStrategy, print_style=None):
+class FeieyunStatusPoller:
+    """
+    飞鹅云状态后台轮询器
+    
+    定期批量查询所有打印机状态并写入缓存，同时确认已提交打印任务的
+    实际出纸状态，确认后再更新PrintLog和订单状态。
+    
+    打印机和打印任务使用登记时传入的客户端查询，与提交任务的打印策略
+    使用同一个账号和API地址。应用启动时通过start_feieyun_status_poller
+    开启全局轮询器，之后创建的飞鹅云打印策略会自动使用它。
+    """
+    
+    def __init__(self, client: FeieyunClient = None, printer_sns=None, status_ttl=60,
+                 poll_interval=15, confirm_timeout=300):
         """
-        初始化饮料和食物分开打印策略
+        初始化状态轮询器
         
         Args:
-            base_strategy: 基础打印策略，用于实际执行打印
-            print_style: 打印样式配置
+            client: 登记时没有指定客户端的打印机和任务使用的客户端，
+                如果为None则使用默认配置创建
+            printer_sns: 需要轮询状态的打印机SN列表
+            status_ttl: 打印机状态缓存有效期（秒）
+            poll_interval: 轮询间隔（秒）
+            confirm_timeout: 打印任务确认超时时间（秒），超时后记为失败
         """
-        super().__init__(print_style)
-        self.base_strategy = base_strategy
+        self.client = client or FeieyunClient()
+        if printer_sns is None:
+            default_sn = load_backend("config").FEIEYUN_SN
+            printer_sns = [default_sn] if default_sn else []
+        # 打印机SN -> 查询状态使用的客户端，None表示使用self.client
+        self._printers: Dict[str, Optional[FeieyunClient]] = {sn: None for sn in printer_sns}
+        self.status_cache = PrinterStatusCache(status_ttl)
+        self.poll_interval = poll_interval
+        self.confirm_timeout = confirm_timeout
+        # 飞鹅云订单ID -> (PrintLog ID, 订单ID, 打印单拆分路径, 提交时间, 客户端)
+        self._pending: Dict[str, tuple] = {}
+        # 订单ID -> 已出纸的打印单拆分路径、是否有打印单失败、最后更新时间
+        self._orders: Dict[object, dict] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
     
-    def print(self, order: Order, db: Session):
+    @property
+    def printer_sns(self) -> set:
+        """需要轮询状态的打印机SN"""
+        with self._lock:
+            return set(self._printers)
+    
+    def add_printer(self, sn: str, client: FeieyunClient = None):
         """
-        将订单分为饮料和食物两部分分别打印
+        添加需要轮询状态的打印机
         
         Args:
-            order: 订单对象
-            db: 数据库会话
-            
-        Returns:
-            dict: 包含打印结果的字典
+            sn: 打印机SN
+            client: 查询该打印机使用的客户端，如果为None则使用self.client
         """
-        # 分离饮料和食物项
-        beverage_items = []
-        food_items = []
-        
-        for item in order.items:
-            # 判断是否为饮料
-            is_beverage = False
-            
-            # 通过food_type判断
-            if hasattr(item, 'food_type') and item.food_type == "beverage":
-                is_beverage = True
-            # 通过code判断
-            elif item.code and (item.code.startswith("COC") or item.code.startswith("BEV")):
-                is_beverage = True
-            # 通过名称判断
-            elif hasattr(item, 'name') and any(drink in item.name.lower() for drink in 
-                                             ["cola", "soda", "water", "juice", "tea", "coffee"]):
-                is_beverage = True
-            
-            if is_beverage:
-                beverage_items.append(item)
-            else:
-                food_items.append(item)
-        
-        # 如果没有饮料或食物，则直接打印原始订单
-        if not beverage_items or not food_items:
-            return self.base_strategy.print(order, db)
-        
-        # 创建饮料订单副本
-        beverage_order = Order(
-            user_id=order.user_id,
-            order_no=order.order_no,
-            table_no=order.table_no,
-            date_time=order.date_time,
-            status=order.status,
-            print_count=order.print_count,
-            last_print_time=order.last_print_time
-        )
-        beverage_order.items = beverage_items
-        
-        # 创建食物订单副本
-        food_order = Order(
-            user_id=order.user_id,
-            order_no=order.order_no,
-            table_no=order.table_no,
-            date_time=order.date_time,
-            status=order.status,
-            print_count=order.print_count,
-            last_print_time=order.last_print_time
-        )
-        food_order.items = food_items
-        
-        # 分别打印饮料和食物订单
-        beverage_result = self.base_strategy.print(beverage_order, db)
-        food_result = self.base_strategy.print(food_order, db)
+        with self._lock:
+            if client is not None or sn not in self._printers:
+                self._printers[sn] = client
+    
+    def is_printer_available(self, sn: str) -> bool:
+        """根据缓存判断打印机是否可用，不发起网络请求"""
+        return self.status_cache.is_available(sn)
+    
+    def track_print(self, feieyun_order_id: str, print_log_id, order_id=None, client: FeieyunClient = None,
+                    parts=()):
+        """
+        登记已被飞鹅云接受、等待确认出纸的打印任务
         
-        # 合并结果
-        if beverage_result["success"] and food_result["success"]:
-            return {
-                "success": True,
-                "message": "饮料和食物订单分别打印成功",
-                "code": "0",
-                "beverage_result": beverage_result,
-                "food_result": food_result
-            }
-        else:
-            return {
-                "success": False,
-                "message": f"打印失败: 饮料订单: {beverage_result['message']}, 食物订单: {food_result['message']}",
-                "code": "500",
-                "beverage_result": beverage_result,
-                "food_result": food_result
-            }
-
-
-class OrderPrinter:
-    """订单打印器"""
+        Args:
+            feieyun_order_id: Open_printMsg返回的飞鹅云订单ID
+            print_log_id: 对应的打印日志ID
+            order_id: 对应的原始订单ID，订单的所有打印单都出纸后更新该订单的打印状态
+            client: 提交任务使用的客户端，如果为None则使用self.client
+            parts: 打印单的拆分路径（PrintSlip.parts），打印整个订单时为空
+        """
+        with self._lock:
+            self._pending[feieyun_order_id] = (print_log_id, order_id, tuple(parts), time.monotonic(), client)
     
-    def __init__(self, strategy: PrintStrategy, separate_beverage_food=True):
+    def record_printed_part(self, order_id, parts):
         """
-        初始化订单打印器
+        登记订单中已经同步打印成功的打印单
+        
+        同一订单的打印单分布在飞鹅云和局域网打印机上时，局域网打印机的部分
+        不经过轮询确认，需要登记后订单才能在飞鹅云部分出纸后被标记为已打印。
         
         Args:
-            strategy: 打印策略
-            separate_beverage_food: 已废弃，始终使用True
+            order_id: 原始订单ID
+            parts: 打印单的拆分路径
         """
-        self.strategy = strategy
-        self.separate_beverage_food = True
+        with self._lock:
+            self._order_state(order_id)["parts"].add(tuple(parts))
+    
+    def _order_state(self, order_id) -> dict:
+        """获取订单的确认状态，调用方需持有self._lock"""
+        state = self._orders.get(order_id)
+        if state is None:
+            state = self._orders[order_id] = {"parts": set(), "failed": False}
+        state["updated_at"] = time.monotonic()
+        return state
     
-    def execute(self, order: Order, db: Session, max_retries=3):
+    @staticmethod
+    def _parts_complete(parts) -> bool:
         """
-        执行打印
+        判断已出纸的打印单是否覆盖了整个订单
         
         Args:
-            order: 订单对象
-            db: 数据库会话
-            max_retries: 最大重试次数
+            parts: 已出纸打印单的拆分路径集合
             
         Returns:
-            dict: 包含打印结果的字典
+            bool: 每一级拆分的每一张都已出纸时返回True
+        """
+        if () in parts:
+            return True
+        
+        # 按第一级拆分分组，再递归检查每一张的下级拆分
+        children: Dict[tuple, set] = {}
+        for path in parts:
+            children.setdefault(path[0], set()).add(path[1:])
+        counts = {count for _, count in children}
+        if len(counts) != 1:
+            return False
+        
+        count = counts.pop()
+        return all(
+            (index, count) in children and FeieyunStatusPoller._parts_complete(children[(index, count)])
+            for index in range(1, count + 1)
+        )
+    
+    def pending_count(self) -> int:
+        """等待确认的打印任务数"""
+        with self._lock:
+            return len(self._pending)
+    
+    def refresh_printer_status(self):
+        """批量查询所有打印机状态并更新缓存"""
+        with self._lock:
+            printers = list(self._printers.items())
+        
+        for sn, client in printers:
+            try:
+                result = (client or self.client).call('Open_queryPrinterStatus', sn=sn)
+            except Exception as e:
+                logger.warning("查询打印机%s状态失败: %s", sn, e)
+                continue
+            
+            if result.get('ret') == 0:
+                self.status_cache.set(sn, parse_feieyun_printer_status(result.get('data')))
+    
+    def confirm_pending(self, db: Session) -> int:
+        """
+        批量查询等待确认的打印任务，并更新打印日志和订单状态
+        
+        Args:
+            db: 数据库会话
+            
+        Returns:
+            int: 本次确认（成功或超时）的任务数
+        """
+        from app.models.order import Order, PrintLog
+        
+        with self._lock:
+            pending = list(self._pending.items())
+        
+        resolved = 0
+        for feieyun_order_id, (print_log_id, order_id, parts, submitted_at, client) in pending:
+            # 查询失败时仍然检查超时，API长时间不可用时任务也会结束
+            try:
+                result = (client or self.client).call('Open_queryOrderState', orderid=feieyun_order_id)
+                printed = result.get('ret') == 0 and result.get('data') is True
+            except Exception as e:
+                logger.warning("查询打印任务%s状态失败: %s", feieyun_order_id, e)
+                printed = False
+            
+            timed_out = time.monotonic() - submitted_at > self.confirm_timeout
+            if not printed and not timed_out:
+                continue
+            
+            print_log = db.query(PrintLog).filter(PrintLog.id == print_log_id).first()
+            if print_log:
+                if printed:
+                    print_log.status = "success"
+                    print_log.response_msg = "打印机已出纸"
+                else:
+                    print_log.status = "failed"
+                    print_log.response_code = "unconfirmed"
+                    print_log.response_msg = "打印任务超时未确认"
+            
+            db.commit()
+            
+            with self._lock:
+                self._pending.pop(feieyun_order_id, None)
+                if order_id is not None:
+                    state = self._order_state(order_id)
+                    if printed:
+                        state["parts"].add(parts)
+                    else:
+                        state["failed"] = True
+            resolved += 1
+        
+        # 订单的所有打印单都出纸后才更新订单状态，任意一张超时则不更新
+        for order_id in self._settle_orders():
+            order = db.query(Order).filter(Order.id == order_id).first()
+            if order:
+                mark_order_printed(order, db)
+        
+        return resolved
+    
+    def _settle_orders(self) -> list:
+        """
+        清理已经有结论的订单确认状态
+        
+        Returns:
+            list: 所有打印单都已出纸的订单ID
+        """
+        completed = []
+        now = time.monotonic()
+        with self._lock:
+            waiting = {entry[1] for entry in self._pending.values()}
+            for order_id, state in list(self._orders.items()):
+                if not state["failed"] and self._parts_complete(state["parts"]):
+                    completed.append(order_id)
+                    del self._orders[order_id]
+                elif order_id not in waiting and (
+                        state["failed"] or now - state["updated_at"] > self.confirm_timeout):
+                    # 有打印单失败，或剩余的打印单一直没有提交
+                    del self._orders[order_id]
+        return completed
+    
+    def poll_once(self, db: Session) -> int:
+        """
+        执行一次轮询
+        
+        Args:
+            db: 数据库会话
+            
+        Returns:
+            int: 本次确认的任务数
+        """
+        self.refresh_printer_status()
+        return self.confirm_pending(db)
+    
+    def start(self, session_factory):
+        """
+        启动后台轮询线程
+        
+        Args:
+            session_factory: 创建数据库会话的可调用对象，每次轮询使用新会话
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory,), name="feieyun-status-poller", daemon=True
+        )
+        self._thread.start()
+    
+    def stop(self, timeout=None):
+        """停止后台轮询线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def _run(self, session_factory):
+        """后台轮询循环"""
+        while not self._stop_event.is_set():
+            db = session_factory()
+            try:
+                self.poll_once(db)
+            except Exception as e:
+                logger.warning("飞鹅云状态轮询失败: %s", e)
+            finally:
+                db.close()
+            self._stop_event.wait(self.poll_interval)
+
+
+# 全局状态轮询器，未开启时为None
+_status_poller: Optional[FeieyunStatusPoller] = None
+
+
+def start_feieyun_status_poller(session_factory, **kwargs) -> FeieyunStatusPoller:
+    """
+    开启全局飞鹅云状态轮询器
+    
+    应在创建打印策略之前调用，之后没有显式传入status_poller的飞鹅云打印策略
+    （包括PrintStrategyFactory和TenantPrintConfig创建的策略）都会使用它。
+    
+    Args:
+        session_factory: 创建数据库会话的可调用对象
+        **kwargs: 传给FeieyunStatusPoller的参数
+        
+    Returns:
+        FeieyunStatusPoller: 已启动的轮询器
+    """
+    global _status_poller
+    if _status_poller is None:
+        _status_poller = FeieyunStatusPoller(**kwargs)
+    _status_poller.start(session_factory)
+    return _status_poller
+
+
+def stop_feieyun_status_poller(timeout=None):
+    """停止并移除全局飞鹅云状态轮询器"""
+    global _status_poller
+    if _status_poller is not None:
+        _status_poller.stop(timeout)
+        _status_poller = None
+
+
+def get_feieyun_status_poller() -> Optional[FeieyunStatusPoller]:
+    """获取全局飞鹅云状态轮询器，未开启时返回None"""
+    return _status_poller
+
+
+def settle_split_print(order, db: Session, slips, results) -> bool:
+    """
+    拆分打印全部成功后更新原始订单状态
+    
+    没有等待确认的打印单时直接标记订单已打印；否则由轮询器在所有打印单
+    出纸后标记，这里把已同步打印成功的打印单登记到全局轮询器。
+    
+    Args:
+        order: 原始订单对象或打印单
+        db: 数据库会话
+        slips: 拆分出的打印单
+        results: 与slips一一对应的打印结果
+        
+    Returns:
+        bool: 是否有等待确认的打印单
+    """
+    pending_confirmation = any(result.get("pending_confirmation") for result in results)
+    if not pending_confirmation:
+        mark_order_printed(order, db)
+    elif _status_poller is not None:
+        for slip, result in zip(slips, results):
+            if not result.get("pending_confirmation"):
+                _status_poller.record_printed_part(slip.id, getattr(slip, "parts", ()))
+    return pending_confirmation
+
+
+class FeieyunPrintStrategy(PrintStrategy):
+    """飞鹅云HTTP API打印策略"""
+    formatter_backend = "feieyun_formatter"
+    
+    def __init__(self, print_style=None, feieyun_sn=None, feieyun_user=None, feieyun_ukey=None, feieyun_url=None,
+                 client: FeieyunClient = None, status_poller: FeieyunStatusPoller = None):
+        """
+        初始化飞鹅云打印策略
+        
+        Args:
+            print_style: 打印样式配置
+            feieyun_sn: 打印机SN
+            feieyun_user: 飞鹅云账号
+            feieyun_ukey: 飞鹅云UKEY
+            feieyun_url: 已废弃，始终使用德国区域API地址
+            client: 飞鹅云API客户端，测试时可传入本地替身
+            status_poller: 状态轮询器，传入后打印任务在确认出纸后才标记为成功，
+                如果为None则使用全局轮询器（未开启时立即标记为成功）
+        """
+        super().__init__(print_style)
+        
+        # 使用传入的参数，如果没有则使用默认值
+        config = load_backend("config")
+        self.feieyun_sn = feieyun_sn or config.FEIEYUN_SN
+        self.feieyun_user = feieyun_user or config.FEIEYUN_USER
+        self.feieyun_ukey = feieyun_ukey or config.FEIEYUN_UKEY
+        
+        # 强制使用新的API地址
+        self.feieyun_url = FEIEYUN_API_URL
+        
+        self.client = client or FeieyunClient(self.feieyun_user, self.feieyun_ukey, self.feieyun_url)
+        self.status_poller = status_poller or _status_poller
+        if self.status_poller:
+            self.status_poller.add_printer(self.feieyun_sn, self.client)
+        
+        logger.debug("飞鹅云打印策略初始化完成，使用API地址: %s", self.feieyun_url)
+    
+    @property
+    def destination(self) -> str:
+        return self.feieyun_sn
+    
+    def _generate_signature(self, timestamp):
+        """
+        生成飞鹅云API签名
+        
+        Args:
+            timestamp: 当前时间戳
+            
+        Returns:
+            str: 签名字符串
+        """
+        return self.client.generate_signature(timestamp)
+    
+    def print(self, order: Order, db: Session):
+        """
+        通过飞鹅云API打印订单
+        
+        Args:
+            order: 订单对象
+            db: 数据库会话
+            
+        Returns:
+            dict: 包含打印结果的字典
+        """
+        from app.models.order import PrintLog
+        
+        # 格式化订单内容
+        content = self.formatter.format(order)
+        
+        # 创建打印日志记录
+        print_log = PrintLog(
+            order_id=str(order.id), user_id=order.user_id,
+            printer_sn=self.feieyun_sn,
+            status="pending",
+            content=content
+        )
+        db.add(print_log)
+        db.commit()
+        
+        # 缓存显示打印机离线或缺纸时直接失败，不发起网络请求
+        if self.status_poller and not self.status_poller.is_printer_available(self.feieyun_sn):
+            status = self.status_poller.status_cache.get(self.feieyun_sn)
+            print_log.status = "failed"
+            print_log.response_code = status
+            print_log.response_msg = f"打印机状态: {status}"
+            db.commit()
+            
+            return {
+                "success": False,
+                "message": f"打印失败: 打印机状态异常 ({status})",
+                "code": status,
+                "content": content
+            }
+        
+        try:
+            # 发送HTTP请求，打印联数使用配置的值
+            result = self.client.call(
+                'Open_printMsg',
+                sn=self.feieyun_sn,
+                content=content,
+                times=str(self.print_style.copies)
+            )
+            
+            # 打印成功
+            if result.get('ret') == 0:
+                print_log.response_code = str(result.get('ret'))
+                print_log.response_msg = result.get('msg', '打印成功')
+                
+                # ret为0只表示飞鹅云已接受任务，由轮询器确认出纸后再更新状态
+                if self.status_poller and result.get('data'):
+                    print_log.status = "submitted"
+                    db.commit()
+                    self.status_poller.track_print(
+                        result.get('data'), print_log.id, order.id, self.client, getattr(order, "parts", ())
+                    )
+                    
+                    return {
+                        "success": True,
+                        "message": "打印任务已提交",
+                        "code": str(result.get('ret')),
+                        "content": content,
+                        "feieyun_order_id": result.get('data'),
+                        "pending_confirmation": True
+                    }
+                
+                print_log.status = "success"
+                db.commit()
+                
+                # 更新订单打印状态
+                mark_order_printed(order, db)
+                
+                return {
+                    "success": True,
+                    "message": "打印成功",
+                    "code": str(result.get('ret')),
+                    "content": content
+                }
+            # 打印失败
+            else:
+                print_log.status = "failed"
+                print_log.response_code = str(result.get('ret'))
+                print_log.response_msg = result.get('msg', '打印失败')
+                db.commit()
+                
+                return {
+                    "success": False,
+                    "message": f"打印失败: {result.get('msg')}",
+                    "code": str(result.get('ret')),
+                    "content": content
+                }
+        # HTTP错误
+        except FeieyunHTTPError as e:
+            print_log.status = "failed"
+            print_log.response_code = str(e.status_code)
+            print_log.response_msg = f"HTTP错误: {e.status_code}"
+            db.commit()
+            
+            return {
+                "success": False,
+                "message": f"打印失败: HTTP错误 {e.status_code}",
+                "code": str(e.status_code)
+            }
+        # 异常错误
+        except Exception as e:
+            print_log.status = "failed"
+            print_log.response_code = "error"
+            print_log.response_msg = str(e)
+            db.commit()
+            
+            return {
+                "success": False,
+                "message": f"打印失败: {str(e)}",
+                "code": "error"
+            }
+
+
+_default_print_style = None
+
+
+def get_default_print_style():
+    """
+    获取按配置联数创建的默认打印样式，只创建一次
+    
+    Returns:
+        PrintStyle: 默认打印样式
+    """
+    global _default_print_style
+    if _default_print_style is None:
+        _default_print_style = load_backend("print_style")(copies=load_backend("config").PRINT_COPIES)
+    return _default_print_style
+
+
+class PrintStrategyFactory:
+    """打印策略工厂"""
+    
+    @staticmethod
+    def create_strategy(print_type, print_style=None, separate_beverage_food=None, **kwargs):
+        """
+        创建打印策略
+        
+        Args:
+            print_type: 打印机类型，可以是"feieyun"、"socket"、"usb"等
+            print_style: 打印样式配置
+            separate_beverage_food: 已废弃，始终使用True
+            **kwargs: 传递给打印策略的额外参数
+            
+        Returns:
+            PrintStrategy: 打印策略实例
+        """
+        # 设置打印样式
+        if not print_style:
+            print_style = get_default_print_style()
+        
+        # 始终分开打印饮料和食物
+        separate_beverage_food = True
+        
+        # 创建基础打印策略
+        if print_type == "feieyun":
+            base_strategy = FeieyunPrintStrategy(print_style, **kwargs)
+        elif print_type == "socket":
+            base_strategy = EscPosPrintStrategy(print_style, **kwargs)
+        elif print_type == "usb":
+            base_strategy = USBPrintStrategy(print_style, port=kwargs.get("port"))
+        else:
+            raise ValueError(f"不支持的打印类型: {print_type}")
+        
+        # 始终使用装饰器模式包装基础策略实现分开打印
+        return SeparateBeverageFoodPrintStrategy(base_strategy, print_style)
+
+
+class SeparateBeverageFoodPrintStrategy(PrintStrategy):
+    """饮料和食物分开打印策略"""
+    def __init__(self, base_strategy: PrintStrategy, print_style=None):
+        """
+        初始化饮料和食物分开打印策略
+        
+        Args:
+            base_strategy: 基础打印策略，用于实际执行打印
+            print_style: 打印样式配置
+        """
+        super().__init__(print_style)
+        self.base_strategy = base_strategy
+    
+    @property
+    def destination(self) -> str:
+        return self.base_strategy.destination
+    
+    def with_scheduler(self, scheduler: PrintScheduler, priority=PRIORITY_NEW_ORDER) -> PrintStrategy:
+        """拆分饮料和食物后，每张打印单再经调度器排队"""
+        return SeparateBeverageFoodPrintStrategy(
+            self.base_strategy.with_scheduler(scheduler, priority), self.print_style
+        )
+    
+    def print(self, order: Order, db: Session):
+        """
+        将订单分为饮料和食物两部分分别打印
+        
+        Args:
+            order: 订单对象
+            db: 数据库会话
+            
+        Returns:
+            dict: 包含打印结果的字典
+        """
+        # 分离饮料和食物项
+        beverage_items, food_items = split_beverage_food(order.items)
+        
+        # 如果没有饮料或食物，则直接打印原始订单
+        if not beverage_items or not food_items:
+            return self.base_strategy.print(order, db)
+        
+        # 创建饮料和食物打印单
+        beverage_order = PrintSlip(order, beverage_items, part=(1, 2))
+        food_order = PrintSlip(order, food_items, part=(2, 2))
+        
+        # 分别打印饮料和食物订单
+        beverage_result = self.base_strategy.print(beverage_order, db)
+        food_result = self.base_strategy.print(food_order, db)
+        
+        # 合并结果
+        if beverage_result["success"] and food_result["success"]:
+            # 已提交等待确认的任务由轮询器更新订单状态
+            pending_confirmation = settle_split_print(
+                order, db, (beverage_order, food_order), (beverage_result, food_result)
+            )
+            
+            return {
+                "success": True,
+                "message": "饮料和食物订单分别打印成功",
+                "code": "0",
+                "beverage_result": beverage_result,
+                "food_result": food_result,
+                "pending_confirmation": pending_confirmation
+            }
+        else:
+            return {
+                "success": False,
+                "message": f"打印失败: 饮料订单: {beverage_result['message']}, 食物订单: {food_result['message']}",
+                "code": "500",
+                "beverage_result": beverage_result,
+                "food_result": food_result
+            }
+
+
+class OrderPrinter:
+    """订单打印器"""
+    
+    def __init__(self, strategy: PrintStrategy, separate_beverage_food=True, scheduler: PrintScheduler = None):
+        """
+        初始化订单打印器
+        
+        Args:
+            strategy: 打印策略
+            separate_beverage_food: 已废弃，始终使用True
+            scheduler: 打印调度器，如果指定则拆分后的每张打印单经调度器排队后再打印
+        """
+        self.strategy = strategy
+        self.separate_beverage_food = True
+        self.scheduler = scheduler
+        # 优先级分类 -> 经调度器排队的策略
+        self._scheduled_strategies: Dict[str, PrintStrategy] = {}
+    
+    def _get_strategy(self, priority) -> PrintStrategy:
+        """获取实际执行打印的策略，使用调度器时按优先级分类缓存"""
+        if self.scheduler is None:
+            return self.strategy
+        
+        strategy = self._scheduled_strategies.get(priority)
+        if strategy is None:
+            strategy = self._scheduled_strategies[priority] = self.strategy.with_scheduler(self.scheduler, priority)
+        return strategy
+    
+    def execute(self, order: Order, db: Session, max_retries=3, priority=PRIORITY_NEW_ORDER):
+        """
+        执行打印
+        
+        Args:
+            order: 订单对象
+            db: 数据库会话
+            max_retries: 最大重试次数
+            priority: 优先级分类，只在使用调度器时生效
+            
+        Returns:
+            dict: 包含打印结果的字典
         """
         # 执行打印
-        result = self.strategy.print(order, db)
+        result = self._get_strategy(priority).print(order, db)
+        
+        # 如果打印失败且需要重试
+        if not result.get("success") and max_retries > 0:
+            time.sleep(1)  # 等待1秒再重试
+            return self.execute(order, db, max_retries-1, priority)
+        
+        return result
+
+
+class PrintJob:
+    """调度器中的打印任务，大订单会被拆分为多个分片"""
+    
+    def __init__(self, order: Order, db: Session, strategy: PrintStrategy, priority: str, chunks: list,
+                 max_retries=0):
+        """
+        初始化打印任务
+        
+        Args:
+            order: 原始订单对象
+            db: 数据库会话
+            strategy: 执行打印的策略
+            priority: 优先级分类
+            chunks: 拆分后的订单分片列表
+            max_retries: 每个分片失败后的最大重试次数
+        """
+        self.order = order
+        self.db = db
+        self.strategy = strategy
+        self.priority = priority
+        self.max_retries = max_retries
+        self.destination = strategy.destination
+        self.chunks = chunks
+        self.results = []
+        self.result = None
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        # 该任务上一个分片的虚拟完成时间
+        self.last_finish = 0.0
+    
+    @property
+    def done(self) -> bool:
+        """任务的所有分片是否都已打印"""
+        return self.result is not None
+
+
+class PrintScheduler:
+    """
+    打印调度器，位于打印策略之前
+    
+    每台目标打印机维护一个独立的加权公平队列，每个任务作为一个流，
+    权重由优先级分类决定。大订单按菜品数拆分为分片，小订单可以插在
+    大订单的分片之间打印，分片在单号后标注第几张。
+    
+    默认每台打印机有一个后台工作线程负责出队打印，提交任务的线程只在wait()
+    中等待自己的任务完成，不会替其他请求打印。工作线程使用任务提交时的数据库
+    会话，提交任务的线程在等待期间不应再使用该会话。
+    
+    workers为False时不启动工作线程，由调用run()、dispatch_next()或wait()的
+    线程打印；同一台打印机同一时间仍只有一个线程在打印。
+    """
+    
+    def __init__(self, max_chunk_items=8, weights=None, max_retries=0, workers=True):
+        """
+        初始化打印调度器
+        
+        Args:
+            max_chunk_items: 每个分片最多包含的菜品数
+            weights: 优先级分类到权重的映射，如果为None则使用PRIORITY_WEIGHTS
+            max_retries: 每个分片失败后的最大重试次数
+            workers: 是否为每台打印机启动后台工作线程
+        """
+        self.max_chunk_items = max_chunk_items
+        self.weights = weights or PRIORITY_WEIGHTS
+        self.max_retries = max_retries
+        self.workers = workers
+        self._lock = threading.Lock()
+        # 有新分片、打印机空闲或任务完成时通知等待的线程
+        self._changed = threading.Condition(self._lock)
+        self._sequence = 0
+        # 正在打印的打印机
+        self._busy = set()
+        # 每台打印机的工作线程
+        self._workers: Dict[str, threading.Thread] = {}
+        self._stopped = False
+        # 每台打印机的待打印分片堆：(虚拟完成时间, 序号, 任务, 分片)
+        self._queues: Dict[str, list] = {}
+        # 每台打印机的虚拟时间
+        self._virtual_time: Dict[str, float] = {}
+        # 每个优先级分类的排队等待统计
+        self._wait_stats = {
+            priority: {"count": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in self.weights
+        }
+    
+    def _split_order(self, order: Order) -> list:
+        """
+        按菜品数将订单拆分为分片
+        
+        Args:
+            order: 订单对象
+            
+        Returns:
+            list: 订单分片列表，小订单直接返回原订单
+        """
+        items = list(order.items)
+        if len(items) <= self.max_chunk_items:
+            return [order]
+        
+        starts = range(0, len(items), self.max_chunk_items)
+        return [
+            PrintSlip(order, items[start:start + self.max_chunk_items], part=(index, len(starts)), label_part=True)
+            for index, start in enumerate(starts, 1)
+        ]
+    
+    def submit(self, order: Order, db: Session, strategy: PrintStrategy, priority=PRIORITY_NEW_ORDER,
+               max_retries=None) -> PrintJob:
+        """
+        提交打印任务
+        
+        Args:
+            order: 订单对象
+            db: 数据库会话
+            strategy: 执行打印的策略
+            priority: 优先级分类，可以是new_order、add_on、reprint、report
+            max_retries: 每个分片的最大重试次数，如果为None则使用调度器的设置
+            
+        Returns:
+            PrintJob: 打印任务，打印完成后可通过result获取结果
+        """
+        if priority not in self.weights:
+            raise ValueError(f"不支持的打印优先级: {priority}")
+        
+        if max_retries is None:
+            max_retries = self.max_retries
+        job = PrintJob(order, db, strategy, priority, self._split_order(order), max_retries)
+        weight = self.weights[priority]
+        
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("打印调度器已停止")
+            
+            queue = self._queues.setdefault(job.destination, [])
+            virtual_time = self._virtual_time.get(job.destination, 0.0)
+            
+            # 新任务从当前虚拟时间开始，分片的完成时间按菜品数除以权重递增
+            job.last_finish = virtual_time
+            for chunk in job.chunks:
+                size = max(len(chunk.items), 1)
+                job.last_finish += size / weight
+                self._sequence += 1
+                heapq.heappush(queue, (job.last_finish, self._sequence, job, chunk))
+            
+            if self.workers:
+                self._ensure_worker(job.destination)
+            self._changed.notify_all()
         
-        # 如果打印失败且需要重试
-        if not result.get("success") and max_retries > 0:
-            time.sleep(1)  # 等待1秒再重试
-            return self.execute(order, db, max_retries-1)
+        return job
+    
+    def _ensure_worker(self, destination: str):
+        """确保打印机的工作线程在运行，调用方需持有self._lock"""
+        worker = self._workers.get(destination)
+        if worker is None or not worker.is_alive():
+            worker = threading.Thread(
+                target=self._work, args=(destination,), name=f"print-scheduler-{destination}", daemon=True
+            )
+            self._workers[destination] = worker
+            worker.start()
+    
+    def _work(self, destination: str):
+        """工作线程循环：打印机空闲且有待打印分片时出队打印"""
+        while True:
+            with self._lock:
+                while not self._stopped and (not self._queues.get(destination) or destination in self._busy):
+                    self._changed.wait()
+                if self._stopped:
+                    return
+            self.dispatch_next(destination)
+    
+    def stop(self, timeout=None):
+        """
+        停止所有工作线程，停止后不再接受新任务
         
-        return result
+        Args:
+            timeout: 等待每个工作线程结束的超时时间（秒）
+        """
+        with self._lock:
+            self._stopped = True
+            workers = list(self._workers.values())
+            self._changed.notify_all()
+        
+        for worker in workers:
+            worker.join(timeout)
+    
+    def pending_count(self, destination=None) -> int:
+        """
+        获取待打印的分片数
+        
+        Args:
+            destination: 目标打印机标识，如果为None则统计所有打印机
+            
+        Returns:
+            int: 待打印的分片数
+        """
+        with self._lock:
+            if destination is not None:
+                return len(self._queues.get(destination, []))
+            return sum(len(queue) for queue in self._queues.values())
+    
+    def dispatch_next(self, destination: str):
+        """
+        打印指定打印机队列中虚拟完成时间最小的分片
+        
+        Args:
+            destination: 目标打印机标识
+            
+        Returns:
+            PrintJob: 被处理的任务，如果队列为空或打印机正在打印则返回None
+        """
+        with self._lock:
+            queue = self._queues.get(destination)
+            if not queue or destination in self._busy:
+                return None
+            self._busy.add(destination)
+            finish, _, job, chunk = heapq.heappop(queue)
+            self._virtual_time[destination] = finish
+            
+            # 任务的第一个分片开始打印时记录排队等待时间
+            if job.started_at is None:
+                job.started_at = time.monotonic()
+                wait = job.started_at - job.enqueued_at
+                stats = self._wait_stats[job.priority]
+                stats["count"] += 1
+                stats["total_wait"] += wait
+                stats["max_wait"] = max(stats["max_wait"], wait)
+        
+        merged = None
+        try:
+            result = OrderPrinter(job.strategy).execute(chunk, job.db, max_retries=job.max_retries)
+            # 同一任务的分片都在同一台打印机上，打印机忙碌标记保证这里不会并发
+            job.results.append(result)
+            if len(job.results) == len(job.chunks):
+                merged = self._merge_results(job)
+        except Exception as e:
+            logger.exception(f"调度器打印订单 {job.order.order_no} 时出错")
+            # 出错时直接结束任务，避免等待的线程一直阻塞
+            merged = {"success": False, "message": f"打印出错: {str(e)}", "code": "500",
+                      "chunk_results": job.results}
+            with self._lock:
+                self._queues[destination] = [entry for entry in self._queues[destination] if entry[2] is not job]
+                heapq.heapify(self._queues[destination])
+        finally:
+            with self._lock:
+                if merged is not None:
+                    job.result = merged
+                self._busy.discard(destination)
+                self._changed.notify_all()
+        
+        return job
+    
+    def wait(self, job: PrintJob) -> dict:
+        """
+        等待任务打印完成
+        
+        有工作线程时只等待；没有工作线程时在当前线程中处理任务所在打印机的
+        队列，任务完成后立即返回，不继续打印排在后面的其他任务。
+        
+        Args:
+            job: submit返回的打印任务
+            
+        Returns:
+            dict: 任务的打印结果
+        """
+        while True:
+            with self._lock:
+                if job.done:
+                    return job.result
+                if self.workers or job.destination in self._busy:
+                    self._changed.wait()
+                    continue
+            self.dispatch_next(job.destination)
+    
+    def run(self):
+        """
+        依次处理所有打印机队列，直到全部打印完成
+        
+        各打印机之间轮流出队，避免某台打印机的积压影响其他打印机。
+        
+        Returns:
+            int: 处理的分片数
+        """
+        processed = 0
+        while True:
+            with self._lock:
+                destinations = [dest for dest, queue in self._queues.items() if queue]
+                if not destinations:
+                    return processed
+                if all(dest in self._busy for dest in destinations):
+                    # 剩余的打印机都在被其他线程使用
+                    self._changed.wait()
+                    continue
+            
+            for destination in destinations:
+                if self.dispatch_next(destination) is not None:
+                    processed += 1
+    
+    def _merge_results(self, job: PrintJob) -> dict:
+        """
+        合并任务各分片的打印结果
+        
+        Args:
+            job: 打印任务
+            
+        Returns:
+            dict: 包含打印结果的字典
+        """
+        if len(job.results) == 1:
+            return job.results[0]
+        
+        if all(result.get("success") for result in job.results):
+            # 分片打印的是打印单，需要更新原始订单的打印状态
+            pending_confirmation = settle_split_print(job.order, job.db, job.chunks, job.results)
+            
+            return {
+                "success": True,
+                "message": f"订单分{len(job.results)}次打印成功",
+                "code": "0",
+                "chunk_results": job.results,
+                "pending_confirmation": pending_confirmation
+            }
+        
+        failed = [result.get("message") for result in job.results if not result.get("success")]
+        return {
+            "success": False,
+            "message": f"打印失败: {'; '.join(failed)}",
+            "code": "500",
+            "chunk_results": job.results
+        }
+    
+    def get_wait_stats(self) -> Dict[str, dict]:
+        """
+        获取各优先级分类的排队等待时间统计
+        
+        Returns:
+            Dict[str, dict]: 优先级分类到统计数据的映射，时间单位为秒
+        """
+        with self._lock:
+            return {
+                priority: {
+                    "count": stats["count"],
+                    "avg_wait": stats["total_wait"] / stats["count"] if stats["count"] else 0.0,
+                    "max_wait": stats["max_wait"]
+                }
+                for priority, stats in self._wait_stats.items()
+            }
 
 
-# 添加类别与打印机关联的打印策略
-class CategoryPrinterStrategy(PrintStrategy):
-    """根据菜品分类选择打印机的策略"""
+class ScheduledPrintStrategy(PrintStrategy):
+    """经调度器排队后再由基础策略打印，由PrintStrategy.with_scheduler创建"""
     
-    def __init__(self, print_style=None, db=None):
+    def __init__(self, base_strategy: PrintStrategy, scheduler: PrintScheduler, priority=PRIORITY_NEW_ORDER):
         """
-        初始化分类打印策略
+        初始化排队打印策略
         
         Args:
-            print_style: 打印样式配置
+            base_strategy: 直接连接打印机的基础策略
+            scheduler: 打印调度器
+            priority: 优先级分类
+        """
+        super().__init__(base_strategy.print_style)
+        self.base_strategy = base_strategy
+        self.scheduler = scheduler
+        self.priority = priority
+    
+    @property
+    def destination(self) -> str:
+        return self.base_strategy.destination
+    
+    def with_scheduler(self, scheduler: PrintScheduler, priority=PRIORITY_NEW_ORDER) -> PrintStrategy:
+        return self.base_strategy.with_scheduler(scheduler, priority)
+    
+    def print(self, order: Order, db: Session):
+        """
+        提交到调度器并等待打印完成
+        
+        Args:
+            order: 订单对象或打印单
             db: 数据库会话
+            
+        Returns:
+            dict: 包含打印结果的字典
         """
-        super().__init__(print_style)
-        self.db = db
-        self.default_strategy = FeieyunPrintStrategy(print_style)
+        job = self.scheduler.submit(order, db, self.base_strategy, self.priority)
+        return self.scheduler.wait(job)
+
+
+def create_printer_strategy(printer, print_style=None, feieyun_client: FeieyunClient = None) -> Optional[PrintStrategy]:
+    """
+    根据打印机配置创建打印策略
+    
+    Args:
+        printer: 打印机配置，需要type及对应类型的连接字段
+        print_style: 打印样式配置
+        feieyun_client: 飞鹅云API客户端
+        
+    Returns:
+        Optional[PrintStrategy]: 打印策略，不支持的打印机类型返回None
+    """
+    if printer.type == "feieyun":
+        return FeieyunPrintStrategy(print_style, feieyun_sn=printer.feieyun_sn, client=feieyun_client)
+    elif printer.type == "socket":
+        return EscPosPrintStrategy(print_style, socket_ip=printer.socket_ip, socket_port=printer.socket_port)
+    elif printer.type == "usb":
+        return USBPrintStrategy(print_style, port=printer.usb_port)
+    return None
+
+
+class PrinterInfo:
+    """打印机配置的只读副本，不依赖数据库会话"""
+    __slots__ = ("type", "feieyun_sn", "socket_ip", "socket_port", "usb_port")
+    
+    def __init__(self, type, feieyun_sn=None, socket_ip=None, socket_port=None, usb_port=None):
+        self.type = type
+        self.feieyun_sn = feieyun_sn
+        self.socket_ip = socket_ip
+        self.socket_port = socket_port
+        self.usb_port = usb_port
     
-    def _get_category_printers(self, category: str) -> List[Printer]:
+    @classmethod
+    def from_printer(cls, printer: Printer) -> PrinterInfo:
+        """从Printer模型复制配置"""
+        return cls(
+            type=printer.type,
+            feieyun_sn=getattr(printer, "feieyun_sn", None),
+            socket_ip=getattr(printer, "socket_ip", None),
+            socket_port=getattr(printer, "socket_port", None),
+            usb_port=getattr(printer, "usb_port", None)
+        )
+
+
+class TenantPrintConfig:
+    """
+    单个餐厅（user_id）的打印配置快照
+    
+    加载时一次性构建分类到打印策略的映射和菜品code到分类的映射，
+    打印时只做字典查找。快照创建后不再修改，配置变化时整体替换。
+    """
+    
+    def __init__(self, user_id, category_printers: Dict[str, List[PrinterInfo]], print_style,
+                 dish_categories: Dict[str, str] = None, feieyun_client: FeieyunClient = None, version=None):
+        """
+        初始化打印配置快照
+        
+        Args:
+            user_id: 餐厅用户ID
+            category_printers: 菜品分类到打印机列表的映射
+            print_style: 打印样式配置
+            dish_categories: 菜品code到分类的映射，用于菜品本身没有分类的情况
+            feieyun_client: 该餐厅使用的飞鹅云API客户端，为None时使用默认配置
+            version: 配置版本，用于版本检查
+        """
+        self.user_id = user_id
+        self.category_printers = category_printers
+        self.print_style = print_style
+        self.dish_categories = dish_categories or {}
+        self.feieyun_client = feieyun_client or FeieyunClient()
+        self.version = version
+        self.loaded_at = time.monotonic()
+        
+        # 未配置打印机的分类使用默认的飞鹅云打印机
+        self.default_strategy = FeieyunPrintStrategy(print_style, client=self.feieyun_client)
+        
+        # 同一分类配置了多台打印机时，与之前一样使用最后一台
+        self.category_strategies: Dict[str, PrintStrategy] = {}
+        for category, printers in category_printers.items():
+            for printer in printers:
+                strategy = create_printer_strategy(printer, print_style, self.feieyun_client)
+                if strategy:
+                    self.category_strategies[category] = strategy
+    
+    def with_print_style(self, print_style) -> TenantPrintConfig:
         """
-        获取指定分类对应的打印机列表
+        使用其他打印样式创建配置快照，打印机和菜品分类与当前快照相同
         
         Args:
-            category: 菜品分类
+            print_style: 打印样式配置
             
         Returns:
-            List[Printer]: 打印机列表
+            TenantPrintConfig: 新的打印配置快照
         """
-        if not self.db:
-            return []
+        return TenantPrintConfig(
+            self.user_id, self.category_printers, print_style,
+            self.dish_categories, self.feieyun_client, self.version
+        )
+    
+    def with_scheduler(self, scheduler: PrintScheduler, priority=PRIORITY_NEW_ORDER) -> TenantPrintConfig:
+        """
+        创建各分类策略都经调度器排队的配置快照
         
-        from app.services import setting_service
-        return setting_service.get_printer_by_category(self.db, category)
+        Args:
+            scheduler: 打印调度器
+            priority: 优先级分类
+            
+        Returns:
+            TenantPrintConfig: 新的打印配置快照，与当前快照共用打印机连接配置
+        """
+        scheduled = copy.copy(self)
+        scheduled.default_strategy = self.default_strategy.with_scheduler(scheduler, priority)
+        scheduled.category_strategies = {
+            category: strategy.with_scheduler(scheduler, priority)
+            for category, strategy in self.category_strategies.items()
+        }
+        return scheduled
     
-    def _get_strategies_for_order(self, order: Order) -> Dict[str, PrintStrategy]:
+    def get_item_category(self, item) -> Optional[str]:
         """
-        获取订单中各个分类对应的打印策略
+        获取菜品分类
         
         Args:
-            order: 订单对象
+            item: 订单菜品
             
         Returns:
-            Dict[str, PrintStrategy]: 分类到打印策略的映射
+            Optional[str]: 菜品分类，无法确定时返回None
+        """
+        if hasattr(item, 'category') and item.category:
+            return item.category
+        if hasattr(item, 'code') and item.code:
+            return self.dish_categories.get(item.code)
+        return None
+    
+    def get_strategy(self, category) -> PrintStrategy:
+        """获取分类对应的打印策略，未配置时返回默认策略"""
+        return self.category_strategies.get(category, self.default_strategy)
+
+
+def load_tenant_config(db: Session, user_id) -> TenantPrintConfig:
+    """
+    从数据库加载餐厅的打印配置
+    
+    Args:
+        db: 数据库会话
+        user_id: 餐厅用户ID
+        
+    Returns:
+        TenantPrintConfig: 打印配置快照
+    """
+    from app.models.dish import Dish
+    from app.services import setting_service
+    
+    # 一次查询所有菜品分类，同时建立code到分类的映射
+    query = db.query(Dish.code, Dish.category).filter(Dish.category.isnot(None))
+    if user_id is not None and hasattr(Dish, "user_id"):
+        query = query.filter(Dish.user_id == user_id)
+    
+    categories = set()
+    dish_categories = {}
+    for code, category in query.all():
+        categories.add(category)
+        if code:
+            dish_categories[code] = category
+    
+    # 每个分类只在加载时查询一次打印机
+    category_printers = {}
+    for category in categories:
+        printers = setting_service.get_printer_by_category(db, category)
+        if printers:
+            category_printers[category] = [PrinterInfo.from_printer(printer) for printer in printers]
+    
+    return TenantPrintConfig(user_id, category_printers, get_default_print_style(), dish_categories)
+
+
+def get_tenant_config_version(db: Session, user_id) -> tuple:
+    """
+    获取餐厅打印配置的版本
+    
+    打印机和菜品表各取一次行数和最近修改时间，新增、删除或修改记录后版本都会变化。
+    模型没有updated_at字段时只能发现新增和删除，修改由缓存的max_age兜底。
+    
+    Args:
+        db: 数据库会话
+        user_id: 餐厅用户ID
+        
+    Returns:
+        tuple: 配置版本
+    """
+    from sqlalchemy import func
+    from app.models.dish import Dish
+    from app.models.setting import Printer
+    
+    version = []
+    for model in (Printer, Dish):
+        columns = [func.count()]
+        if hasattr(model, "updated_at"):
+            columns.append(func.max(model.updated_at))
+        query = db.query(*columns).select_from(model)
+        if user_id is not None and hasattr(model, "user_id"):
+            query = query.filter(model.user_id == user_id)
+        version.append(tuple(query.one()))
+    return tuple(version)
+
+
+class TenantConfigCache:
+    """
+    按餐厅缓存打印配置快照
+    
+    配置可能由其他进程（如Next.js后台）修改，因此除了notify_changed外，
+    还可以传入version_getter，每隔check_interval秒比对一次版本，版本变化时
+    重新加载；设置max_age后快照超过该时间一定会重新加载。
+    """
+    
+    def __init__(self, loader=None, version_getter=None, check_interval=30.0, max_age=None):
         """
-        if not self.db:
-            return {"default": self.default_strategy}
+        初始化配置缓存
         
-        # 从订单中提取菜品分类
-        categories = set()
-        for item in order.items:
-            # 假设菜品数据有category字段
-            # 这里需要根据实际情况修改
-            if hasattr(item, 'category') and item.category:
-                categories.add(item.category)
-            # 如果是从数据库获取菜品分类
-            elif hasattr(item, 'code') and item.code:
-                dish = self.db.query(Dish).filter(Dish.code == item.code).first()
-                if dish and dish.category:
-                    categories.add(dish.category)
-        
-        # 获取每个分类对应的打印机和策略
-        strategies = {}
-        for category in categories:
-            printers = self._get_category_printers(category)
-            
-            # 如果该分类配置了打印机
-            if printers:
-                for printer in printers:
-                    # 创建对应的打印策略
-                    if printer.type == "feieyun":
-                        strategy = FeieyunPrintStrategy(
-                            self.print_style,
-                            feieyun_sn=printer.feieyun_sn
-                        )
-                    elif printer.type == "socket":
-                        strategy = EscPosPrintStrategy(
-                            self.print_style,
-                            socket_ip=printer.socket_ip,
-                            socket_port=printer.socket_port
-                        )
-                    elif printer.type == "usb":
-                        strategy = USBPrintStrategy(
-                            self.print_style,
-                            port=printer.usb_port
-                        )
-                    else:
-                        continue
-                    
-                    strategies[category] = strategy
+        Args:
+            loader: 加载配置的函数，签名为(db, user_id) -> TenantPrintConfig，默认为load_tenant_config
+            version_getter: 获取配置版本的函数，签名为(db, user_id) -> 版本，为None时不做版本检查
+            check_interval: 版本检查间隔（秒）
+            max_age: 快照最长使用时间（秒），为None时不限制
+        """
+        self.loader = loader or load_tenant_config
+        self.version_getter = version_getter
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._configs: Dict[object, TenantPrintConfig] = {}
+        self._checked_at: Dict[object, float] = {}
+        # 每个餐厅的失效次数，加载期间收到变更通知时不缓存加载结果
+        self._generations: Dict[object, int] = {}
+        # 每个餐厅独立的加载锁，一个餐厅加载配置时不阻塞其他餐厅
+        self._tenant_locks: Dict[object, threading.Lock] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, db: Session, user_id) -> TenantPrintConfig:
+        """
+        获取餐厅的打印配置，未缓存或版本变化时加载
+        
+        Args:
+            db: 数据库会话
+            user_id: 餐厅用户ID
+            
+        Returns:
+            TenantPrintConfig: 打印配置快照
+        """
+        config = self._configs.get(user_id)
+        if config is not None and not self._expired(config) and not self._version_check_due(user_id):
+            return config
+        
+        with self._tenant_lock(user_id):
+            config = self._configs.get(user_id)
+            if config is not None and self._expired(config):
+                config = None
+            
+            version = None
+            if config is not None and self._version_check_due(user_id):
+                version = self.version_getter(db, user_id)
+                self._checked_at[user_id] = time.monotonic()
+                if version != config.version:
+                    config = None
+            
+            if config is None:
+                with self._lock:
+                    generation = self._generations.get(user_id, 0)
+                
+                # 先读版本再加载，加载期间的修改会使下一次版本检查失败并重新加载
+                if self.version_getter and version is None:
+                    version = self.version_getter(db, user_id)
+                config = self.loader(db, user_id)
+                if self.version_getter:
+                    config.version = version
+                
+                with self._lock:
+                    if self._generations.get(user_id, 0) == generation:
+                        self._configs[user_id] = config
+                        self._checked_at[user_id] = time.monotonic()
+            
+            return config
+    
+    def _tenant_lock(self, user_id) -> threading.Lock:
+        """获取餐厅的加载锁"""
+        with self._lock:
+            lock = self._tenant_locks.get(user_id)
+            if lock is None:
+                lock = self._tenant_locks[user_id] = threading.Lock()
+            return lock
+    
+    def _expired(self, config: TenantPrintConfig) -> bool:
+        return self.max_age is not None and time.monotonic() - config.loaded_at >= self.max_age
+    
+    def _version_check_due(self, user_id) -> bool:
+        if not self.version_getter:
+            return False
+        return time.monotonic() - self._checked_at.get(user_id, 0.0) >= self.check_interval
+    
+    def notify_changed(self, user_id=None):
+        """
+        打印机或分类配置变化时使缓存失效
         
-        # 如果没有配置任何打印机，使用默认策略
-        if not strategies:
-            strategies["default"] = self.default_strategy
+        Args:
+            user_id: 餐厅用户ID，为None时清空所有餐厅的缓存
+        """
+        with self._lock:
+            user_ids = list(self._configs) if user_id is None else [user_id]
+            for changed in user_ids:
+                self._configs.pop(changed, None)
+                self._checked_at.pop(changed, None)
+                self._generations[changed] = self._generations.get(changed, 0) + 1
+
+
+# 进程内共享的餐厅配置缓存：每30秒比对一次打印机和菜品的版本，快照最多使用5分钟；
+# 同一进程内修改打印机配置后也可以调用notify_changed立即失效
+tenant_config_cache = TenantConfigCache(version_getter=get_tenant_config_version, max_age=300.0)
+
+
+# 添加类别与打印机关联的打印策略
+class CategoryPrinterStrategy(PrintStrategy):
+    """根据菜品分类选择打印机的策略"""
+    
+    def __init__(self, print_style=None, db: Session = None, config_cache: TenantConfigCache = None):
+        """
+        初始化分类打印策略
         
-        return strategies
+        Args:
+            print_style: 打印样式配置，如果为None则使用餐厅配置中的默认样式
+            db: 已废弃，配置在打印时通过传入的数据库会话加载，保留该参数只为兼容旧的调用方式
+            config_cache: 餐厅配置缓存，如果为None则使用进程内共享的缓存
+        """
+        super().__init__(print_style)
+        self.config_cache = config_cache or tenant_config_cache
+        self._custom_print_style = print_style is not None
+        # (调度器, 优先级分类)，由with_scheduler设置
+        self._scheduling = None
+        # 餐厅用户ID -> (缓存中的配置快照, 使用自定义样式或经调度器排队的快照)
+        self._derived_configs: Dict[object, tuple] = {}
+    
+    def with_scheduler(self, scheduler: PrintScheduler, priority=PRIORITY_NEW_ORDER) -> PrintStrategy:
+        """按分类拆分后，每张打印单在其目标打印机的队列中排队"""
+        strategy = CategoryPrinterStrategy(
+            self.print_style if self._custom_print_style else None, config_cache=self.config_cache
+        )
+        strategy._scheduling = (scheduler, priority)
+        return strategy
+    
+    def _get_config(self, db: Session, user_id) -> TenantPrintConfig:
+        """获取餐厅的打印配置，指定了打印样式或调度器时使用据此重建的快照"""
+        config = self.config_cache.get(db, user_id)
+        if not self._custom_print_style and self._scheduling is None:
+            return config
+        
+        derived = self._derived_configs.get(user_id)
+        if derived is None or derived[0] is not config:
+            derived_config = config
+            if self._custom_print_style:
+                derived_config = derived_config.with_print_style(self.print_style)
+            if self._scheduling is not None:
+                derived_config = derived_config.with_scheduler(*self._scheduling)
+            derived = (config, derived_config)
+            self._derived_configs[user_id] = derived
+        return derived[1]
     
     def print(self, order: Order, db: Session):
         """
@@ -663,29 +2113,48 @@ class CategoryPrinterStrategy(PrintStrategy):
         Returns:
             dict: 包含打印结果的字典
         """
-        # 保存数据库会话
-        self.db = db
-        
-        # 获取订单中各分类对应的打印策略
-        strategies = self._get_strategies_for_order(order)
+        # 餐厅的打印配置已缓存，分类路由只需字典查找
+        config = self._get_config(db, order.user_id)
         
-        # 如果只有默认策略，直接使用它打印整个订单
-        if len(strategies) == 1 and "default" in strategies:
-            return strategies["default"].print(order, db)
-        
-        # 否则，根据菜品分类分别打印
+        # 根据菜品分类拆分订单，未配置打印机的分类使用默认策略
+        grouped_items: Dict[str, list] = {}
+        for item in order.items:
+            category = config.get_item_category(item)
+            key = category if category in config.category_strategies else "default"
+            grouped_items.setdefault(key, []).append(item)
+        
+        # 所有菜品都由同一台打印机打印时不需要拆分
+        if len(grouped_items) <= 1:
+            key = next(iter(grouped_items), "default")
+            return config.get_strategy(key).print(order, db)
+        
+        slips = [
+            PrintSlip(order, items, part=(index, len(grouped_items)))
+            for index, items in enumerate(grouped_items.values(), 1)
+        ]
         results = []
-        success_count = 0
-        
-        # 实现按分类分别打印的逻辑
-        # 注意：这需要实现订单拆分功能，这里只是示意
-        # 实际实现可能需要根据需求修改
+        for key, slip in zip(grouped_items, slips):
+            result = config.get_strategy(key).print(slip, db)
+            result["category"] = key
+            results.append(result)
+        
+        if all(result.get("success") for result in results):
+            # 已提交等待确认的任务由轮询器更新订单状态
+            pending_confirmation = settle_split_print(order, db, slips, results)
+            
+            return {
+                "success": True,
+                "message": "分类打印成功",
+                "code": "0",
+                "details": results,
+                "pending_confirmation": pending_confirmation
+            }
         
-        # 这里简单返回一个成功结果
+        failed = [f"{result['category']}: {result.get('message')}" for result in results if not result.get("success")]
         return {
-            "success": True,
-            "message": "分类打印成功",
-            "code": "0",
+            "success": False,
+            "message": f"打印失败: {'; '.join(failed)}",
+            "code": "500",
             "details": results
         }
 
@@ -693,6 +2162,47 @@ class CategoryPrinterStrategy(PrintStrategy):
 class PrintReportService:
     """打印报表服务，用于总结打印日志和生成报表"""
     
+    @staticmethod
+    def get_dish_price_map(db: Session) -> Dict[str, float]:
+        """
+        获取菜品code到价格的映射
+        
+        Args:
+            db: 数据库会话
+            
+        Returns:
+            Dict[str, float]: 菜品code到价格的映射
+        """
+        from app.models.dish import Dish
+        
+        # 只查询code和price两列，避免加载完整的菜品对象
+        rows = db.query(Dish.code, Dish.price).filter(Dish.code.isnot(None)).all()
+        return {code: price for code, price in rows if code}
+    
+    @staticmethod
+    def calculate_order_amount(order: Order, dish_price_map: Dict[str, float]) -> float:
+        """
+        根据菜品价格映射计算订单金额
+        
+        Args:
+            order: 订单对象
+            dish_price_map: 菜品code到价格的映射
+            
+        Returns:
+            float: 订单金额
+        """
+        order_amount = 0.0
+        for item in order.items:
+            # 从菜品表中查询价格
+            item_price = 0
+            if hasattr(item, 'code') and item.code and item.code in dish_price_map:
+                item_price = dish_price_map[item.code]
+            
+            qty = item.qty or 1
+            order_amount += item_price * qty
+        
+        return order_amount
+    
     @staticmethod
     def get_daily_print_summary(db: Session, date=None):
         """
@@ -707,6 +2217,7 @@ class PrintReportService:
         """
         from sqlalchemy import func, and_
         from datetime import datetime, time
+        from app.models.order import Order, PrintLog
         
         # 如果未指定日期，使用当天日期
         if date is None:
@@ -733,11 +2244,7 @@ class PrintReportService:
         order_map = {order.user_id: order for order in orders}
         
         # 获取所有菜品，创建code到价格的映射
-        dishes = db.query(Dish).all()
-        dish_price_map = {}
-        for dish in dishes:
-            if dish.code:
-                dish_price_map[dish.code] = dish.price
+        dish_price_map = PrintReportService.get_dish_price_map(db)
         
         # 统计总金额和订单数
         total_amount = 0.0
@@ -748,16 +2255,7 @@ class PrintReportService:
             order = order_map.get(log.user_id)
             if order:
                 # 计算订单金额
-                order_amount = 0.0
-                for item in order.items:
-                    # 从菜品表中查询价格
-                    item_price = 0
-                    if hasattr(item, 'code') and item.code and item.code in dish_price_map:
-                        item_price = dish_price_map[item.code]
-                    
-                    qty = item.qty or 1
-                    item_total = item_price * qty
-                    order_amount += item_total
+                order_amount = PrintReportService.calculate_order_amount(order, dish_price_map)
                 
                 # 添加到订单总结
                 order_summary.append({
@@ -794,8 +2292,9 @@ class PrintReportService:
         Returns:
             dict: 包含打印机使用情况总结的字典
         """
-        from sqlalchemy import func, and_
+        from sqlalchemy import func, and_, case
         from datetime import datetime, time
+        from app.models.order import PrintLog
         
         # 如果未指定日期，使用当天日期
         if date is None:
@@ -809,11 +2308,11 @@ class PrintReportService:
         printer_stats = db.query(
             PrintLog.printer_sn,
             func.count(PrintLog.id).label('total_prints'),
-            func.sum(func.case(
+            func.sum(case(
                 (PrintLog.status == 'success', 1),
                 else_=0
             )).label('success_prints'),
-            func.sum(func.case(
+            func.sum(case(
                 (PrintLog.status == 'failed', 1),
                 else_=0
             )).label('failed_prints')
@@ -840,4 +2339,170 @@ class PrintReportService:
         return {
             "date": date.strftime("%d-%m-%Y"),
             "printer_summary": printer_summary
-        }
\ No newline at end of file
+        }
+
+
+class PrintHistoryExporter:
+    """打印历史流式导出器，按任意日期范围导出CSV或NDJSON"""
+    
+    # 导出字段，CSV表头与NDJSON键名保持一致
+    EXPORT_FIELDS = [
+        "print_time", "order_id", "user_id", "order_no", "table_no",
+        "printer_sn", "amount", "item_count"
+    ]
+    
+    def __init__(self, db: Session, batch_size=500):
+        """
+        初始化导出器
+        
+        Args:
+            db: 数据库会话
+            batch_size: 每批从数据库游标读取的行数
+        """
+        self.db = db
+        self.batch_size = batch_size
+    
+    def iter_rows(self, start_date, end_date=None, user_id=None) -> Iterator[dict]:
+        """
+        逐行生成指定日期范围内打印成功的订单记录
+        
+        使用服务端游标分批读取，每批订单的菜品用一次IN查询预加载。
+        同一订单有多条打印成功记录时（饮料/食物分单、补打），金额和菜品数
+        只记在该订单范围内的第一条记录上，其余记录为0，保证按列求和不会重复
+        计算。第一条记录由数据库分组查询确定，内存占用与日期范围大小无关。
+        
+        Args:
+            start_date: 开始日期（包含）
+            end_date: 结束日期（包含），如果为None则与开始日期相同
+            user_id: 餐厅用户ID，如果为None则导出所有用户
+            
+        Yields:
+            dict: 单条导出记录，键为EXPORT_FIELDS
+        """
+        from sqlalchemy import and_, cast, func, String
+        from sqlalchemy.orm import aliased, selectinload
+        from datetime import time
+        from app.models.order import Order, PrintLog
+        
+        if end_date is None:
+            end_date = start_date
+        
+        # 使用左闭右开区间，避免遗漏23:59:59之后的记录
+        start_datetime = datetime.combine(start_date, time(0, 0, 0))
+        end_datetime = datetime.combine(end_date + timedelta(days=1), time(0, 0, 0))
+        
+        # 菜品价格映射只包含code和价格，体积很小，可以常驻内存
+        dish_price_map = PrintReportService.get_dish_price_map(self.db)
+        
+        filters = [
+            PrintLog.print_time >= start_datetime,
+            PrintLog.print_time < end_datetime,
+            PrintLog.status == "success"
+        ]
+        if user_id is not None:
+            filters.append(PrintLog.user_id == user_id)
+        
+        # 范围内的打印成功记录按订单分组编号，序号为1的是该订单的第一条
+        ranked = self.db.query(
+            PrintLog,
+            func.row_number().over(
+                partition_by=PrintLog.order_id, order_by=PrintLog.id
+            ).label("order_rank")
+        ).filter(
+            and_(*filters)
+        ).subquery()
+        ranked_log = aliased(PrintLog, ranked)
+        
+        # PrintLog.order_id保存的是字符串形式的订单ID
+        query = self.db.query(ranked_log, Order, ranked.c.order_rank).join(
+            Order, cast(Order.id, String) == ranked_log.order_id
+        ).options(
+            selectinload(Order.items)
+        ).order_by(
+            ranked_log.print_time, ranked_log.id
+        ).execution_options(
+            stream_results=True
+        ).yield_per(self.batch_size)
+        
+        for log, order, order_rank in query:
+            amount = 0.0
+            item_count = 0
+            if order_rank == 1:
+                amount = round(float(PrintReportService.calculate_order_amount(order, dish_price_map)), 2)
+                item_count = len(order.items)
+            
+            yield {
+                "print_time": log.print_time.strftime("%d-%m-%Y %H:%M:%S"),
+                "order_id": log.order_id,
+                "user_id": order.user_id,
+                "order_no": order.order_no,
+                "table_no": order.table_no,
+                "printer_sn": log.printer_sn,
+                "amount": amount,
+                "item_count": item_count
+            }
+    
+    def export_csv(self, stream, start_date, end_date=None, user_id=None) -> int:
+        """
+        以CSV格式逐行写入导出记录
+        
+        Args:
+            stream: 可写的文本流
+            start_date: 开始日期（包含）
+            end_date: 结束日期（包含）
+            user_id: 餐厅用户ID
+            
+        Returns:
+            int: 写入的记录数
+        """
+        writer = csv.DictWriter(stream, fieldnames=self.EXPORT_FIELDS)
+        writer.writeheader()
+        
+        count = 0
+        for row in self.iter_rows(start_date, end_date, user_id):
+            writer.writerow(row)
+            count += 1
+        
+        return count
+    
+    def export_ndjson(self, stream, start_date, end_date=None, user_id=None) -> int:
+        """
+        以NDJSON格式逐行写入导出记录
+        
+        Args:
+            stream: 可写的文本流
+            start_date: 开始日期（包含）
+            end_date: 结束日期（包含）
+            user_id: 餐厅用户ID
+            
+        Returns:
+            int: 写入的记录数
+        """
+        count = 0
+        for row in self.iter_rows(start_date, end_date, user_id):
+            stream.write(json.dumps(row, ensure_ascii=False))
+            stream.write("\n")
+            count += 1
+        
+        return count
+    
+    def export(self, stream, start_date, end_date=None, export_format="csv", user_id=None) -> int:
+        """
+        按指定格式导出打印历史
+        
+        Args:
+            stream: 可写的文本流
+            start_date: 开始日期（包含）
+            end_date: 结束日期（包含）
+            export_format: 导出格式，可以是"csv"或"ndjson"
+            user_id: 餐厅用户ID
+            
+        Returns:
+            int: 写入的记录数
+        """
+        if export_format == "csv":
+            return self.export_csv(stream, start_date, end_date, user_id)
+        elif export_format == "ndjson":
+            return self.export_ndjson(stream, start_date, end_date, user_id)
+        else:
+            raise ValueError(f"不支持的导出格式: {export_format}")
@@ -0,0 +1,52 @@
+"""
+打印服务测试的公共工具
+
+测试不依赖后端代码：订单、菜品和数据库会话都使用本文件中的轻量替身。
+"""
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+class FakeItem:
+    """订单菜品"""
+
+    def __init__(self, name, code=None, qty=1, food_type=None, category=None):
+        self.name = name
+        self.code = code
+        self.qty = qty
+        self.food_type = food_type
+        self.category = category
+
+
+class FakeOrder:
+    """与Order字段一致的订单"""
+
+    def __init__(self, id, order_no, items, user_id="test"):
+        self.id = id
+        self.user_id = user_id
+        self.order_no = order_no
+        self.table_no = "1"
+        self.date_time = None
+        self.status = "pending"
+        self.print_count = 0
+        self.last_print_time = None
+        self.items = items
+
+
+class FakeSession:
+    """只记录提交次数的数据库会话"""
+
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+def make_order(id, order_no, item_count, food_type="food", category=None):
+    """创建包含item_count个同类菜品的订单"""
+    items = [FakeItem(f"{order_no}-{i}", food_type=food_type, category=category) for i in range(item_count)]
+    return FakeOrder(id, order_no, items)
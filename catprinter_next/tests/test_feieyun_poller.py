@@ -0,0 +1,207 @@
+"""FeieyunStatusPoller的出纸确认测试，飞鹅云API使用FeieyunClient的本地替身"""
+import sys
+import types
+
+import pytest
+
+import print_service
+from print_service import (
+    CategoryPrinterStrategy, FeieyunClient, FeieyunPrintStrategy, FeieyunStatusPoller, PrintStrategy,
+    SeparateBeverageFoodPrintStrategy, TenantConfigCache, TenantPrintConfig
+)
+from conftest import FakeItem, FakeOrder
+
+
+class Column:
+    """模型字段，比较时返回(字段名, 值)作为查询条件"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, value):
+        return self.name, value
+
+    __hash__ = None
+
+
+class Order:
+    id = Column("id")
+
+
+class PrintLog:
+    id = Column("id")
+
+    def __init__(self, **fields):
+        self.response_code = None
+        self.response_msg = None
+        self.__dict__.update(fields)
+
+
+class FakeQuery:
+    def __init__(self, objects):
+        self.objects = objects
+        self.condition = None
+
+    def filter(self, condition):
+        self.condition = condition
+        return self
+
+    def first(self):
+        name, value = self.condition
+        return next((obj for obj in self.objects if getattr(obj, name) == value), None)
+
+
+class FakeDatabase:
+    """按模型保存对象的数据库会话"""
+
+    def __init__(self, orders=()):
+        self.objects = {Order: list(orders), PrintLog: []}
+
+    def add(self, obj):
+        obj.id = len(self.objects[PrintLog]) + 1
+        self.objects[PrintLog].append(obj)
+
+    def commit(self):
+        pass
+
+    def query(self, model):
+        return FakeQuery(self.objects[model])
+
+    @property
+    def print_logs(self):
+        return self.objects[PrintLog]
+
+
+class StubFeieyunClient(FeieyunClient):
+    """飞鹅云API替身：接受所有打印任务，printed中的任务视为已出纸"""
+
+    def __init__(self):
+        super().__init__("user", "ukey", "http://127.0.0.1/Api/Open/")
+        self.submitted = []
+        self.printed = set()
+        self.reachable = True
+
+    def call(self, apiname, **params):
+        if not self.reachable:
+            raise ConnectionError("API不可用")
+        if apiname == "Open_printMsg":
+            self.submitted.append(f"ORDER{len(self.submitted) + 1}")
+            return {"ret": 0, "msg": "ok", "data": self.submitted[-1]}
+        if apiname == "Open_queryPrinterStatus":
+            return {"ret": 0, "msg": "ok", "data": "在线，工作状态正常。"}
+        if apiname == "Open_queryOrderState":
+            return {"ret": 0, "msg": "ok", "data": params["orderid"] in self.printed}
+        raise AssertionError(apiname)
+
+
+class LanStrategy(PrintStrategy):
+    """同步打印成功的局域网打印机"""
+
+    def __init__(self):
+        super().__init__(print_style=object())
+
+    @property
+    def destination(self):
+        return "socket_bar"
+
+    def print(self, order, db):
+        return {"success": True, "message": "打印成功", "code": "0"}
+
+
+@pytest.fixture(autouse=True)
+def fake_app(monkeypatch):
+    """用替身替换后端模型、配置和格式化器"""
+    models = types.ModuleType("app.models.order")
+    models.Order = Order
+    models.PrintLog = PrintLog
+    monkeypatch.setitem(sys.modules, "app", types.ModuleType("app"))
+    monkeypatch.setitem(sys.modules, "app.models", types.ModuleType("app.models"))
+    monkeypatch.setitem(sys.modules, "app.models.order", models)
+
+    config = types.SimpleNamespace(FEIEYUN_SN="SN1", FEIEYUN_USER="user", FEIEYUN_UKEY="ukey")
+    formatter = type("Formatter", (), {"__init__": lambda self, style: None, "format": lambda self, order: "ticket"})
+    monkeypatch.setitem(print_service._loaded_backends, "config", config)
+    monkeypatch.setitem(print_service._loaded_backends, "print_style", lambda: types.SimpleNamespace(copies=1))
+    monkeypatch.setitem(print_service._loaded_backends, "feieyun_formatter", formatter)
+
+
+@pytest.fixture
+def client():
+    return StubFeieyunClient()
+
+
+@pytest.fixture
+def poller(client):
+    return FeieyunStatusPoller(client, printer_sns=[])
+
+
+def test_single_order_is_marked_after_confirmation(client, poller):
+    order = FakeOrder(1, "A001", [FakeItem("Dumpling", food_type="food")])
+    db = FakeDatabase([order])
+    result = FeieyunPrintStrategy(client=client, status_poller=poller).print(order, db)
+
+    assert result["pending_confirmation"] and db.print_logs[0].status == "submitted"
+    assert poller.confirm_pending(db) == 0
+    assert order.status == "pending"
+
+    client.printed.add(result["feieyun_order_id"])
+    assert poller.confirm_pending(db) == 1
+    assert db.print_logs[0].status == "success"
+    assert order.status == "printed" and order.print_count == 1
+
+
+def test_beverage_food_split_is_marked_once_after_both_slips(client, poller):
+    order = FakeOrder(1, "A001", [FakeItem("Cola", food_type="beverage"), FakeItem("Dumpling", food_type="food")])
+    db = FakeDatabase([order])
+    strategy = SeparateBeverageFoodPrintStrategy(FeieyunPrintStrategy(client=client, status_poller=poller))
+
+    result = strategy.print(order, db)
+    assert result["pending_confirmation"] and poller.pending_count() == 2
+
+    client.printed.add(client.submitted[0])
+    poller.confirm_pending(db)
+    assert order.status == "pending" and order.print_count == 0
+
+    client.printed.add(client.submitted[1])
+    poller.confirm_pending(db)
+    poller.confirm_pending(db)
+    assert order.status == "printed" and order.print_count == 1
+    assert poller.pending_count() == 0
+
+
+def test_mixed_feieyun_and_lan_category_split(client, poller, monkeypatch):
+    monkeypatch.setattr(print_service, "_status_poller", poller)
+    config = TenantPrintConfig("test", {}, types.SimpleNamespace(copies=1), feieyun_client=client)
+    config.category_strategies = {"Drinks": LanStrategy()}
+    strategy = CategoryPrinterStrategy(config_cache=TenantConfigCache(loader=lambda db, user_id: config))
+
+    order = FakeOrder(1, "A001", [FakeItem("Dumpling", category="Dumplings"), FakeItem("Cola", category="Drinks")])
+    db = FakeDatabase([order])
+    result = strategy.print(order, db)
+
+    # 局域网部分已经打印，等待飞鹅云部分出纸
+    assert result["success"] and result["pending_confirmation"]
+    assert order.status == "pending"
+
+    client.printed.add(client.submitted[0])
+    poller.confirm_pending(db)
+    assert order.status == "printed" and order.print_count == 1
+
+
+@pytest.mark.parametrize("reachable", [True, False])
+def test_timeout_leaves_order_unmarked(client, reachable):
+    poller = FeieyunStatusPoller(client, printer_sns=[], confirm_timeout=-1)
+    order = FakeOrder(1, "A001", [FakeItem("Cola", food_type="beverage"), FakeItem("Dumpling", food_type="food")])
+    db = FakeDatabase([order])
+    SeparateBeverageFoodPrintStrategy(FeieyunPrintStrategy(client=client, status_poller=poller)).print(order, db)
+
+    # 一张已出纸，另一张超时；API不可用时两张都按超时处理
+    client.printed.add(client.submitted[0])
+    client.reachable = reachable
+    assert poller.confirm_pending(db) == 2
+
+    assert poller.pending_count() == 0
+    assert order.status == "pending" and order.print_count == 0
+    statuses = [log.status for log in db.print_logs]
+    assert statuses == (["success", "failed"] if reachable else ["failed", "failed"])
+    assert poller._orders == {}
@@ -0,0 +1,154 @@
+"""PrintScheduler的排队、并发和调度入口测试"""
+import time
+import threading
+
+import pytest
+
+import print_service
+from print_service import (
+    PRIORITY_NEW_ORDER, PRIORITY_REPRINT, CategoryPrinterStrategy, OrderPrinter, PrintScheduler,
+    PrintStrategy, SeparateBeverageFoodPrintStrategy, TenantConfigCache, TenantPrintConfig
+)
+from conftest import FakeItem, FakeOrder, FakeSession, make_order
+
+
+class RecordingStrategy(PrintStrategy):
+    """记录打印顺序、并发数和打印线程的策略"""
+
+    def __init__(self, destination, delay=0.0):
+        super().__init__(print_style=object())
+        self._destination = destination
+        self.delay = delay
+        self.printed = []
+        self.threads = set()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def destination(self):
+        return self._destination
+
+    def print(self, order, db):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+            self.printed.append(order.order_no)
+            self.threads.add(threading.current_thread().name)
+        return {"success": True, "message": "ok", "code": "0"}
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = PrintScheduler(max_chunk_items=8)
+    yield scheduler
+    scheduler.stop(timeout=5)
+
+
+def test_small_orders_interleave_with_large_order_chunks():
+    kitchen = RecordingStrategy("kitchen")
+    scheduler = PrintScheduler(max_chunk_items=8, workers=False)
+
+    large = make_order(1, "L", 40)
+    large_job = scheduler.submit(large, FakeSession(), kitchen)
+    scheduler.dispatch_next("kitchen")
+    small_job = scheduler.submit(make_order(2, "S", 2), FakeSession(), kitchen)
+    scheduler.submit(make_order(3, "R", 1), FakeSession(), kitchen, PRIORITY_REPRINT)
+    scheduler.run()
+
+    assert kitchen.printed[0] == "L (1/5)"
+    # 新订单在大订单的第二个分片之前打印，大订单的分片在单号后标注第几张
+    assert kitchen.printed.index("S") < kitchen.printed.index("L (2/5)")
+    assert [no for no in kitchen.printed if no.startswith("L")] == [f"L ({i}/5)" for i in range(1, 6)]
+    assert large_job.result["success"] and small_job.result["success"]
+    assert large.status == "printed" and large.print_count == 1
+
+
+def test_wait_stats_are_recorded_per_priority_class():
+    kitchen = RecordingStrategy("kitchen")
+    scheduler = PrintScheduler(workers=False)
+    scheduler.submit(make_order(1, "A", 1), FakeSession(), kitchen)
+    scheduler.submit(make_order(2, "B", 1), FakeSession(), kitchen)
+    scheduler.submit(make_order(3, "C", 1), FakeSession(), kitchen, PRIORITY_REPRINT)
+    scheduler.run()
+
+    stats = scheduler.get_wait_stats()
+    assert stats[PRIORITY_NEW_ORDER]["count"] == 2
+    assert stats[PRIORITY_REPRINT]["count"] == 1
+    assert stats["report"] == {"count": 0, "avg_wait": 0.0, "max_wait": 0.0}
+    assert stats[PRIORITY_NEW_ORDER]["max_wait"] >= stats[PRIORITY_NEW_ORDER]["avg_wait"] >= 0.0
+
+
+def test_wait_returns_once_own_job_is_done():
+    kitchen = RecordingStrategy("kitchen")
+    scheduler = PrintScheduler(workers=False)
+    job = scheduler.submit(make_order(1, "A", 2), FakeSession(), kitchen)
+    for i in range(5):
+        scheduler.submit(make_order(10 + i, f"X{i}", 2), FakeSession(), kitchen)
+
+    assert scheduler.wait(job)["success"]
+    assert kitchen.printed == ["A"]
+    assert scheduler.pending_count("kitchen") == 5
+
+
+@pytest.mark.parametrize("workers", [True, False])
+def test_destination_is_never_printed_concurrently(workers):
+    kitchen = RecordingStrategy("kitchen", delay=0.01)
+    scheduler = PrintScheduler(max_chunk_items=4, workers=workers)
+    results = []
+
+    def submit(i):
+        order = make_order(i, f"O{i}", 1 + (i % 3) * 4)
+        results.append(OrderPrinter(kitchen, scheduler=scheduler).execute(order, FakeSession(), max_retries=0))
+
+    threads = [threading.Thread(target=submit, args=(i,), name=f"caller-{i}") for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    scheduler.stop(timeout=5)
+
+    assert len(results) == 8 and all(result["success"] for result in results)
+    assert kitchen.max_active == 1
+    if workers:
+        # 调用线程只等待，打印全部由该打印机的工作线程完成
+        assert kitchen.threads == {"print-scheduler-kitchen"}
+
+
+def test_beverage_and_food_slips_are_queued_on_their_printer(scheduler):
+    bar = RecordingStrategy("bar")
+    order = FakeOrder(1, "M", [FakeItem("Cola", food_type="beverage"), FakeItem("Dumpling", food_type="food")])
+
+    result = OrderPrinter(SeparateBeverageFoodPrintStrategy(bar, print_style=object()), scheduler=scheduler) \
+        .execute(order, FakeSession(), max_retries=0)
+
+    assert result["success"]
+    assert bar.printed == ["M", "M"]
+    assert order.status == "printed" and order.print_count == 1
+    assert scheduler.get_wait_stats()[PRIORITY_NEW_ORDER]["count"] == 2
+
+
+def test_category_split_is_queued_per_destination(scheduler, monkeypatch):
+    # 分类配置中的默认策略是飞鹅云策略，构造时需要读取配置和默认打印样式
+    monkeypatch.setitem(print_service._loaded_backends, "config", type("Config", (), {
+        "FEIEYUN_SN": "SN1", "FEIEYUN_USER": "user", "FEIEYUN_UKEY": "ukey"
+    }))
+    monkeypatch.setitem(print_service._loaded_backends, "print_style", object)
+    kitchen = RecordingStrategy("kitchen", delay=0.05)
+    bar = RecordingStrategy("bar")
+    config = TenantPrintConfig("test", {}, object(), feieyun_client=print_service.FeieyunClient("user", "ukey"))
+    config.default_strategy = kitchen
+    config.category_strategies = {"Drinks": bar}
+    strategy = CategoryPrinterStrategy(config_cache=TenantConfigCache(loader=lambda db, user_id: config))
+
+    order = FakeOrder(1, "C", [FakeItem("Dumpling", category="Dumplings"), FakeItem("Cola", category="Drinks")])
+    result = OrderPrinter(strategy, scheduler=scheduler).execute(order, FakeSession(), max_retries=0)
+
+    assert result["success"]
+    assert kitchen.printed == ["C"] and bar.printed == ["C"]
+    assert kitchen.threads == {"print-scheduler-kitchen"}
+    assert bar.threads == {"print-scheduler-bar"}
+    assert order.status == "printed" and order.print_count == 1